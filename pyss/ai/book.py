@@ -0,0 +1,86 @@
+""" Opening books in the Polyglot format.
+
+    A book is a file of 16 byte big-endian entries sorted by position key:
+    key (64 bits), move (16), weight (16) and learn (32), see
+    `pyss.game.board.polyglot` for the keys and moves. The file is mapped into
+    memory and searched in place, a probe reads a few entries.
+"""
+import mmap
+import os
+import random
+import struct
+
+from pyss.game.board.polyglot import decode_polyglot_move
+
+
+ENTRY = struct.Struct(">QHHI")
+
+
+class OpeningBook:
+    def __init__(self, path, seed=None):
+        with open(path, "rb") as f:
+            # an empty file can't be mapped
+            size = os.fstat(f.fileno()).st_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._entries = size // ENTRY.size
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        """Returns the number of entries"""
+        return self._entries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _key(self, i):
+        return struct.unpack_from(">Q", self._mmap, i * ENTRY.size)[0]
+
+    def entries(self, key):
+        """Returns (move, weight, learn) for each entry of the Polyglot key, moves as stored"""
+        low, high = 0, self._entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        found = []
+        for i in range(low, self._entries):
+            entry_key, move, weight, learn = ENTRY.unpack_from(self._mmap, i * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight, learn))
+        return found
+
+    def moves(self, board):
+        """Returns [(move, weight), ...] of the book moves legal on board, moves as `make_move` tuples"""
+        legal = board.generate_legal_moves()
+        found = []
+        for move, weight, _ in self.entries(board.polyglot_key):
+            move = decode_polyglot_move(move)
+            if move in legal:
+                found.append((move, weight))
+        return found
+
+    def choose(self, board, best=False):
+        """ Returns a book move for board, or None when the position is out of book.
+
+            Moves are picked at random in proportion to their weight, or the heaviest with best.
+        """
+        moves = [(move, weight) for move, weight in self.moves(board) if weight]
+        if not moves:
+            return None
+        if best:
+            return max(moves, key=lambda entry: entry[1])[0]
+        return self._random.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+    def close(self):
+        """Unmaps the book file"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+            self._entries = 0
@@ -0,0 +1,402 @@
+""" A simple alpha-beta engine.
+
+    Searches a Chessboard in place with make/unmake: negamax with principal
+    variation search under iterative deepening, a quiescence search over
+    captures, the board's transposition table, and TT move, MVV-LVA, killer
+    and history move ordering. `SimpleEngine.stop` can be called from another
+    thread, it is noticed every `check_every` nodes.
+
+    Given an OpeningBook (see `pyss.ai.book`), positions in the book are
+    answered with a book move straight away, without searching. Given
+    Tablebases (see `pyss.ai.tablebase`), positions in the tables are scored
+    by their distance to mate instead of being searched, and played from the
+    tables at the root.
+
+    With `workers > 1` the search is a Lazy SMP: helper processes search the
+    same position through one transposition table in shared memory, and the
+    main process reports its own result sped up by what the helpers stored.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from dataclasses import dataclass, field
+
+from pyss.game.board.bitboard import BITS, POSITIONS, popcount
+from pyss.game.board.depth.transposition import EXACT, LOWER, UPPER, TranspositionTable
+from pyss.game.board.moves import EN_PASSANT, MOVES, PROMOTION
+from pyss.game.board.tables import PROMOTIONS
+from pyss.game.piece import piece_dict
+
+
+MATE = 100_000
+INFINITY = MATE + 1
+MAX_PLY = 128
+
+# centipawns, kings are never captured
+VALUES = {ty: piece_dict[ty]["value"] * 100 for ty in piece_dict}
+# the king counts as the most valuable attacker when ordering captures
+ATTACKER_VALUES = dict(VALUES, king=20 * 100)
+
+CENTER = BITS[27] | BITS[28] | BITS[35] | BITS[36]
+CENTER_BONUS = 10
+MOBILITY_BONUS = 2
+
+
+def evaluate(board):
+    """Returns the material, center and mobility balance in centipawns for the side to move."""
+    score = 0
+    for color, sign in (("white", 1), ("black", -1)):
+        for ty, bitboard in board.bitboards[color].items():
+            if bitboard:
+                score += sign * (VALUES[ty] * popcount(bitboard) + CENTER_BONUS * popcount(bitboard & CENTER))
+        score += sign * MOBILITY_BONUS * popcount(board.attacked_squares(color))
+
+    return score if board.active_color == "white" else -score
+
+
+@dataclass
+class SearchResult:
+    """ The outcome of the last completed iteration of a search. """
+    move: tuple | None
+    value: int
+    depth: int
+    nodes: int
+    seconds: float
+    pv: list = field(default_factory=list)
+
+    @property
+    def mate(self):
+        """Returns the number of moves to mate, negative if being mated, else None"""
+        if abs(self.value) < MATE - MAX_PLY:
+            return None
+        plies = MATE - abs(self.value)
+        return (plies + 1) // 2 if self.value > 0 else -(plies // 2)
+
+
+class SimpleEngine:
+    def __init__(self, board, check_every=1024, book=None, tablebases=None):
+        self.board = board
+        self.table = board.transposition_table
+        self.book = book
+        self.tablebases = tablebases
+
+        # must be a power of two
+        self.check_every = check_every
+
+        self.nodes = 0
+        self._stop = threading.Event()
+        self._stopped = False
+        self._deadline = None
+        self._node_limit = None
+
+        self._killers = [[0, 0] for _ in range(MAX_PLY)]
+        self._history = [0] * 4096
+        self._root_best = 0
+
+    def stop(self):
+        """Asks a running search to return its last completed iteration"""
+        self._stop.set()
+
+    def search(self, depth=4, time_limit=None, nodes=None, workers=1):
+        """ Searches the position on the board and returns a SearchResult.
+
+            Iterates from depth 1 up to depth, stopping early when time_limit seconds or
+            nodes are used up or `stop` is called. The board is left as it was.
+            workers > 1 searches with that many processes, see the module docstring.
+            A book or tablebase move is returned as a depth 0 result.
+        """
+        start = time.perf_counter()
+        if self.book is not None:
+            move = self.book.choose(self.board)
+            if move is not None:
+                return SearchResult(move=move, value=0, depth=0, nodes=0,
+                                    seconds=time.perf_counter() - start, pv=[move])
+
+        if self.tablebases is not None:
+            move = self.tablebases.best_move(self.board)
+            if move is not None:
+                value = _tablebase_value(self.tablebases.probe(self.board), 0)
+                return SearchResult(move=move, value=value, depth=0, nodes=0,
+                                    seconds=time.perf_counter() - start, pv=[move])
+
+        self._stop.clear()
+        if workers > 1:
+            return self._parallel_search(depth, time_limit, nodes, workers)
+        return self._iterative_deepening(depth, time_limit, nodes)
+
+    def _iterative_deepening(self, depth, time_limit, nodes):
+        self._stopped = False
+        self.nodes = 0
+        start = time.perf_counter()
+        self._deadline = start + time_limit if time_limit is not None else None
+        self._node_limit = nodes
+
+        self._killers = [[0, 0] for _ in range(MAX_PLY)]
+        self._history = [0] * 4096
+
+        result = None
+        for iteration in range(1, min(depth, MAX_PLY - 1) + 1):
+            self._root_best = 0
+            value = self._negamax(iteration, -INFINITY, INFINITY, 0)
+            if self._stopped:
+                break
+
+            result = SearchResult(move=MOVES[self._root_best] if self._root_best else None, value=value,
+                                  depth=iteration, nodes=self.nodes, seconds=time.perf_counter() - start,
+                                  pv=self.principal_variation(iteration))
+            # no need to look deeper than a forced mate
+            if abs(value) >= MATE - iteration:
+                break
+
+        if result is None:
+            # stopped before depth 1 finished, any legal move beats none
+            moves = self.board.generate_move_array()
+            result = SearchResult(move=MOVES[moves[0]] if moves else None, value=0, depth=0,
+                                  nodes=self.nodes, seconds=time.perf_counter() - start)
+
+        return result
+
+    def _parallel_search(self, depth, time_limit, nodes, workers):
+        context = multiprocessing.get_context()
+        mb = self.table.mb
+        memory = SharedMemory(create=True, size=TranspositionTable.nbytes(mb))
+        table, self.table = self.table, TranspositionTable(mb, buffer=memory.buf)
+
+        stop = context.Event()
+        node_counts = context.Queue()
+        # every other helper searches a ply deeper, so they don't all fill in the same entries
+        helpers = [context.Process(target=_helper, daemon=True,
+                                   args=(self.board, memory.name, mb, depth + i % 2, time_limit, nodes,
+                                         self.check_every, stop, node_counts))
+                   for i in range(1, workers)]
+        try:
+            for helper in helpers:
+                helper.start()
+            result = self._iterative_deepening(depth, time_limit, nodes)
+        finally:
+            stop.set()
+            helper_nodes = 0
+            for helper in helpers:
+                try:
+                    helper_nodes += node_counts.get(timeout=10)
+                except queue.Empty:
+                    pass
+            for helper in helpers:
+                helper.join()
+
+            self.table.close()
+            self.table = table
+            memory.close()
+            memory.unlink()
+
+        result.nodes += helper_nodes
+        return result
+
+    def principal_variation(self, depth):
+        """Returns the best line stored in the transposition table, up to depth moves"""
+        board = self.board
+        line, undos = [], []
+        while len(line) < depth:
+            entry = self.table.probe(board.zobrist_key)
+            if entry is None or not entry[3] or entry[3] not in board.generate_move_array():
+                break
+            line.append(MOVES[entry[3]])
+            undos.append(board.make_move(*line[-1]))
+
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        return line
+
+    def _should_stop(self):
+        if self._stop.is_set():
+            return True
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return True
+        return self._node_limit is not None and self.nodes >= self._node_limit
+
+    def _count_node(self):
+        self.nodes += 1
+        if not self.nodes & (self.check_every - 1) and self._should_stop():
+            self._stopped = True
+
+    def _order(self, moves, tt_move, ply, captures_only=False):
+        """Returns moves best first: TT move, captures by MVV-LVA and promotions, killers, then history"""
+        board = self.board
+        grid = board.board
+        enemy = board.occupancy["black" if board.active_color == "white" else "white"]
+        killers = self._killers[ply] if ply < MAX_PLY else ()
+        history = self._history
+
+        scored = []
+        for move in moves:
+            target = move >> 6 & 0x3F
+            flags = move >> 12
+            if move == tt_move:
+                score = 1 << 30
+            elif enemy & BITS[target] or flags == EN_PASSANT:
+                x, y = POSITIONS[move & 0x3F]
+                victim = VALUES["pawn"] if flags == EN_PASSANT else VALUES[grid[target & 7][target >> 3].type]
+                score = (1 << 24) + victim * 16 - ATTACKER_VALUES[grid[x][y].type]
+                if flags >= PROMOTION:
+                    score += VALUES[PROMOTIONS[flags - PROMOTION]]
+            elif flags >= PROMOTION:
+                score = (1 << 24) + VALUES[PROMOTIONS[flags - PROMOTION]]
+            elif captures_only:
+                continue
+            elif move in killers:
+                score = 1 << 22
+            else:
+                score = history[move & 0xFFF]
+            scored.append((score, move))
+
+        scored.sort(reverse=True)
+        return [move for _, move in scored]
+
+    def _negamax(self, depth, alpha, beta, ply):
+        if ply > 0 and self.tablebases is not None:
+            result = self.tablebases.probe(self.board)
+            if result is not None:
+                return _tablebase_value(result, ply)
+
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self._quiesce(alpha, beta, ply)
+
+        self._count_node()
+        if self._stopped:
+            return 0
+
+        board = self.board
+        key = board.zobrist_key
+        original_alpha = alpha
+
+        tt_move = 0
+        entry = self.table.probe(key)
+        if entry is not None:
+            entry_depth, value, flag, tt_move = entry
+            if entry_depth >= depth and ply > 0:
+                value = _from_table(value, ply)
+                if flag == EXACT or (flag == LOWER and value >= beta) or (flag == UPPER and value <= alpha):
+                    return value
+
+        moves = board.generate_move_array()
+        if not moves:
+            return -MATE + ply if board.in_check() else 0
+
+        enemy = board.occupancy["black" if board.active_color == "white" else "white"]
+        best_value, best_move = -INFINITY, 0
+        for i, move in enumerate(self._order(moves, tt_move, ply)):
+            undo = board.make_move(*MOVES[move])
+            if i == 0:
+                value = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            else:
+                # principal variation search, prove the move is worse with a null window
+                value = -self._negamax(depth - 1, -alpha - 1, -alpha, ply + 1)
+                if alpha < value < beta:
+                    value = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+
+            if self._stopped:
+                return 0
+
+            if value > best_value:
+                best_value, best_move = value, move
+                if value > alpha:
+                    alpha = value
+                    if ply == 0:
+                        self._root_best = move
+                    if alpha >= beta:
+                        flags = move >> 12
+                        if not enemy & BITS[move >> 6 & 0x3F] and flags != EN_PASSANT and flags < PROMOTION:
+                            killers = self._killers[ply]
+                            if killers[0] != move:
+                                killers[1], killers[0] = killers[0], move
+                            self._history[move & 0xFFF] += depth * depth
+                        break
+
+        if best_value <= original_alpha:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self.table.store(key, depth, _to_table(best_value, ply), flag, best_move)
+
+        return best_value
+
+    def _quiesce(self, alpha, beta, ply):
+        """Searches captures and promotions until the position is quiet"""
+        self._count_node()
+        if self._stopped:
+            return 0
+
+        board = self.board
+        in_check = board.in_check()
+        if in_check:
+            # only a side in check is looked at for mate, stalemates are left to the main search
+            moves = board.generate_move_array()
+            if not moves:
+                return -MATE + ply
+
+        stand_pat = evaluate(board)
+        if stand_pat >= beta or ply >= MAX_PLY - 1:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+
+        if not in_check:
+            moves = board.generate_move_array(captures_only=True)
+
+        for move in self._order(moves, 0, ply, captures_only=True):
+            undo = board.make_move(*MOVES[move])
+            value = -self._quiesce(-beta, -alpha, ply + 1)
+            board.unmake_move(undo)
+
+            if self._stopped:
+                return 0
+
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+
+        return alpha
+
+
+def _helper(board, name, mb, depth, time_limit, nodes, check_every, stop, node_counts):
+    """Runs one Lazy SMP helper on its own copy of the board"""
+    memory = SharedMemory(name=name)
+    table = TranspositionTable(mb, buffer=memory.buf)
+
+    engine = SimpleEngine(board, check_every=check_every)
+    engine.table = table
+    engine._stop = stop
+    try:
+        engine._iterative_deepening(depth, time_limit, nodes)
+    finally:
+        node_counts.put(engine.nodes)
+        table.close()
+        memory.close()
+
+
+def _tablebase_value(result, ply):
+    # a tablebase's plies to mate counted from the root
+    wdl, plies = result
+    return wdl * (MATE - ply - plies) if wdl else 0
+
+
+def _to_table(value, ply):
+    # mate scores are stored relative to the node, not the root
+    if value >= MATE - MAX_PLY:
+        return value + ply
+    if value <= -MATE + MAX_PLY:
+        return value - ply
+    return value
+
+
+def _from_table(value, ply):
+    if value >= MATE - MAX_PLY:
+        return value - ply
+    if value <= -MATE + MAX_PLY:
+        return value + ply
+    return value
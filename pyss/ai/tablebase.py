@@ -0,0 +1,536 @@
+""" Endgame tablebases by retrograde analysis.
+
+    A table holds the distance to mate in plies of every position of one
+    material signature such as "KQvK", for either side to move. Positions are
+    indexed by the side to move, the white king's square folded into one
+    eighth of the board by the board's symmetries (one half with pawns), then
+    the black king's and every other piece's square. Of the positions a
+    symmetry maps onto each other only the one with the lowest index is kept.
+
+    A table is generated by setting up each position on a PlayableBoard: its
+    captures and promotions are looked up in the smaller tables, mates are
+    found, then wins and losses are spread backwards over unmoves one ply at a
+    time. Castling and en passant are not part of any table, signatures with
+    pawns on both sides are left out for that reason.
+
+    Values are stored as one `array('h')` per table and saved to files that
+    `Tablebases` maps back into memory, a probe is an index computation and
+    one lookup.
+
+    Usage:
+        pyss tablebase KQvK KRvK KPvK -d tablebases
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+
+from pyss.game.board.bitboard import BITS, COLORS, POSITIONS, iter_bits, popcount
+from pyss.game.board.fen import LETTERS, TYPES
+from pyss.game.board.magic import slider_attacks
+from pyss.game.board.moves import PROMOTION
+from pyss.game.board.playable import PlayableBoard
+from pyss.game.board.tables import ATTACKS, PROMOTIONS, SLIDERS
+from pyss.game.piece import Piece, piece_dict
+
+
+logger = logging.getLogger(__name__)
+
+
+# stored values: the side to move mates in v plies, is mated in -v - 1 plies, or draws
+DRAW = 0
+ILLEGAL = -32768
+_UNKNOWN = 32767
+
+WIN = 1
+LOSS = -1
+
+# the order of the pieces in a signature and in the index
+ORDER = ("queen", "rook", "bishop", "knight", "pawn")
+
+MAGIC = b"PYSSTBAS"
+VERSION = 1
+# magic, version, signature, number of values, then the values
+HEADER = struct.Struct("<8sH16sQ")
+
+
+def _transform(function):
+    return tuple(function(square & 7, square >> 3) for square in range(64))
+
+
+# the symmetries of the board as square lookups, the first two keep pawns pointing the same way
+SYMMETRIES = (
+    _transform(lambda x, y: y * 8 + x),
+    _transform(lambda x, y: y * 8 + 7 - x),
+    _transform(lambda x, y: (7 - y) * 8 + x),
+    _transform(lambda x, y: (7 - y) * 8 + 7 - x),
+    _transform(lambda x, y: x * 8 + y),
+    _transform(lambda x, y: x * 8 + 7 - y),
+    _transform(lambda x, y: (7 - x) * 8 + y),
+    _transform(lambda x, y: (7 - x) * 8 + 7 - y),
+)
+MIRRORS = SYMMETRIES[:2]
+# swaps white and black
+FLIP = SYMMETRIES[2]
+
+# where the white king is folded to: the a1-d1-d4 triangle, or the a-d files with pawns
+TRIANGLE = tuple(square for square in range(64) if (square >> 3) <= (square & 7) <= 3)
+HALF = tuple(square for square in range(64) if (square & 7) <= 3)
+
+
+def parse_signature(signature):
+    """Returns the (white, black) piece types of a signature like "KRPvKR", kings left out"""
+    sides = signature.upper().split("V")
+    if len(sides) != 2 or not all(side.startswith("K") for side in sides):
+        raise ValueError(f"Invalid material signature {signature!r}")
+
+    parsed = []
+    for side in sides:
+        letters = side[1:].lower()
+        if any(letter not in TYPES or TYPES[letter] == "king" for letter in letters):
+            raise ValueError(f"Invalid material signature {signature!r}")
+        parsed.append(tuple(sorted((TYPES[letter] for letter in letters), key=ORDER.index)))
+    return tuple(parsed)
+
+
+def make_signature(white, black):
+    """Returns the signature of the piece types of each side, kings left out"""
+    return "v".join("K" + "".join(LETTERS[ty].upper() for ty in sorted(side, key=ORDER.index))
+                    for side in (white, black))
+
+
+def _material(types):
+    return sum(piece_dict[ty]["value"] for ty in types)
+
+
+def canonical_signature(white, black):
+    """Returns (signature, flipped) of the table holding these pieces, the side with more material as white"""
+    signature, flipped = make_signature(white, black), make_signature(black, white)
+    if (_material(black), flipped) > (_material(white), signature):
+        return flipped, True
+    return signature, False
+
+
+def _insufficient(white, black):
+    # a lone knight or bishop can't mate
+    return len(white) + len(black) <= 1 and "pawn" not in white + black and not {"queen", "rook"} & {*white, *black}
+
+
+def _result(value):
+    """Returns a stored value as (WIN, LOSS or DRAW, plies to mate), None if illegal"""
+    if value == ILLEGAL:
+        return None
+    if value > 0:
+        return WIN, value
+    if value < 0:
+        return LOSS, -value - 1
+    return DRAW, 0
+
+
+class Tablebase:
+    """ The values of every position of one material signature, see the module docstring. """
+
+    def __init__(self, signature, values=None):
+        white, black = parse_signature(signature)
+        if "pawn" in white and "pawn" in black:
+            raise ValueError(f"Pawns on both sides need en passant in the index: {signature}")
+        self.signature = make_signature(white, black)
+
+        # the index order: the kings, then the other pieces, white first
+        self.pieces = (("white", "king"), ("black", "king")) + \
+            tuple(("white", ty) for ty in white) + tuple(("black", ty) for ty in black)
+        self._pawns = tuple(ty == "pawn" for _, ty in self.pieces)
+        # (start, end) of each run of identical pieces, their squares are interchangeable
+        self._groups = []
+        start = 2
+        while start < len(self.pieces):
+            end = start
+            while end < len(self.pieces) and self.pieces[end] == self.pieces[start]:
+                end += 1
+            if end - start > 1:
+                self._groups.append((start, end))
+            start = end
+
+        symmetries = MIRRORS if any(self._pawns) else SYMMETRIES
+        self._king_squares = HALF if any(self._pawns) else TRIANGLE
+        self._kings = {square: i for i, square in enumerate(self._king_squares)}
+        # the symmetries taking the white king on each square into its fold
+        self._symmetries = tuple(tuple(symmetry for symmetry in symmetries if symmetry[square] in self._kings)
+                                 for square in range(64))
+
+        self.size = 2 * len(self._king_squares)
+        for pawn in self._pawns[1:]:
+            self.size *= 48 if pawn else 64
+
+        self.values = values if values is not None else array('h', [ILLEGAL]) * self.size
+        self._mmap = None
+
+    def __len__(self):
+        return self.size
+
+    def index(self, squares, stm):
+        """Returns the index of the position of squares, in the order of `pieces`, with COLORS[stm] to move"""
+        best = None
+        for symmetry in self._symmetries[squares[0]]:
+            mapped = [symmetry[square] for square in squares]
+            for start, end in self._groups:
+                mapped[start:end] = sorted(mapped[start:end])
+
+            i = stm * len(self._king_squares) + self._kings[mapped[0]]
+            for square, pawn in zip(mapped[1:], self._pawns[1:]):
+                i = i * 48 + square - 8 if pawn else i * 64 + square
+            if best is None or i < best:
+                best = i
+        return best
+
+    def decode(self, i):
+        """Returns (squares, stm) of an index, which need not be a legal position"""
+        squares = []
+        for pawn in reversed(self._pawns[1:]):
+            if pawn:
+                i, square = divmod(i, 48)
+                squares.append(square + 8)
+            else:
+                i, square = divmod(i, 64)
+                squares.append(square)
+        stm, king = divmod(i, len(self._king_squares))
+        squares.append(self._king_squares[king])
+        squares.reverse()
+        return squares, stm
+
+    def value(self, squares, stm):
+        """Returns (WIN, LOSS or DRAW, plies to mate) of a position, None if it is illegal"""
+        return _result(self.values[self.index(squares, stm)])
+
+    def predecessors(self, i):
+        """Returns the indices of the positions with a move to position i that doesn't capture or promote"""
+        squares, stm = self.decode(i)
+        mover = COLORS[1 - stm]
+        occupied = 0
+        for square in squares:
+            occupied |= BITS[square]
+
+        found = set()
+        for n, (color, ty) in enumerate(self.pieces):
+            if color != mover:
+                continue
+
+            square = squares[n]
+            if ty == "pawn":
+                step = 8 if color == "white" else -8
+                behind = square - step
+                origins = 0
+                # pawns never stand on their first rank
+                if 8 <= behind < 56 and not occupied & BITS[behind]:
+                    origins |= BITS[behind]
+                    if square >> 3 == (3 if color == "white" else 4) and not occupied & BITS[behind - step]:
+                        origins |= BITS[behind - step]
+            elif ty in SLIDERS:
+                origins = slider_attacks(ty, square, occupied) & ~occupied
+            else:
+                origins = ATTACKS[ty][color][square] & ~occupied
+
+            for origin in iter_bits(origins):
+                moved = list(squares)
+                moved[n] = origin
+                found.add(self.index(moved, 1 - stm))
+        return found
+
+    def save(self, path):
+        """Writes the values to a file, see `Tablebases`"""
+        values = self.values
+        if sys.byteorder != "little":
+            values = array('h', values)
+            values.byteswap()
+
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.signature.encode(), self.size))
+            f.write(values)
+
+    @classmethod
+    def load(cls, path):
+        """Maps a file written by `save` into memory"""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, signature, size = HEADER.unpack_from(mapped)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a tablebase file: {path}")
+            table = cls(signature.rstrip(b"\0").decode())
+            if table.size != size or len(mapped) != HEADER.size + size * 2:
+                raise ValueError(f"Truncated tablebase file: {path}")
+        except (ValueError, struct.error):
+            mapped.close()
+            raise
+
+        values = memoryview(mapped)[HEADER.size:].cast('h')
+        if sys.byteorder != "little":
+            values = array('h', values)
+            values.byteswap()
+        table.values = values
+        table._mmap = mapped
+        return table
+
+    def close(self):
+        """Unmaps the file of a loaded table"""
+        if self._mmap is None:
+            return
+        if isinstance(self.values, memoryview):
+            self.values.release()
+        self._mmap.close()
+        self._mmap = None
+
+
+class Tablebases:
+    """ The tables of a directory, loaded when first probed, and the tables generated since. """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._tables = {}
+
+        self.max_pieces = 2
+        if directory is not None and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                signature, extension = os.path.splitext(name)
+                if extension == ".pytb":
+                    self.max_pieces = max(self.max_pieces, len(signature) - 1)
+
+    def _path(self, signature):
+        return os.path.join(self.directory, f"{signature}.pytb")
+
+    def table(self, signature, generate=False):
+        """ Returns the table of a signature, loaded or generated if it isn't at hand, else None.
+
+            A signature with the weaker side as white, like "KvKQ", gets the table of its
+            canonical signature, "KQvK", which holds both.
+        """
+        signature, _ = canonical_signature(*parse_signature(signature))
+        if signature in self._tables:
+            return self._tables[signature]
+
+        if self.directory is not None and os.path.exists(self._path(signature)):
+            table = Tablebase.load(self._path(signature))
+        elif generate:
+            table = self._generate(signature)
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+                table.save(self._path(signature))
+        else:
+            return None
+
+        self._tables[signature] = table
+        self.max_pieces = max(self.max_pieces, len(table.pieces))
+        return table
+
+    def generate(self, signature):
+        """Returns the table of a signature, generating it and the tables it needs if they aren't at hand"""
+        return self.table(signature, generate=True)
+
+    def probe_pieces(self, pieces, stm, generate=False):
+        """ Returns (WIN, LOSS or DRAW, plies to mate) of a position given as ((color, type), square) pairs,
+            with COLORS[stm] to move. None if its table isn't at hand.
+        """
+        white = [ty for (color, ty), _ in pieces if color == "white" and ty != "king"]
+        black = [ty for (color, ty), _ in pieces if color == "black" and ty != "king"]
+        if _insufficient(white, black):
+            return DRAW, 0
+
+        signature, flipped = canonical_signature(white, black)
+        table = self.table(signature, generate)
+        if table is None:
+            return None
+
+        if flipped:
+            pieces = [(("black" if color == "white" else "white", ty), FLIP[square]) for (color, ty), square in pieces]
+            stm = 1 - stm
+
+        squares = {}
+        for piece, square in pieces:
+            squares.setdefault(piece, []).append(square)
+        return table.value([squares[piece].pop() for piece in table.pieces], stm)
+
+    def probe(self, board):
+        """Returns (WIN, LOSS or DRAW, plies to mate) for the side to move on board, None if not in the tables"""
+        occupancy = board.occupancy
+        if popcount(occupancy["white"] | occupancy["black"]) > self.max_pieces or board.castling_rights:
+            return None
+
+        pieces = [((color, ty), square) for color in COLORS for ty, bitboard in board.bitboards[color].items()
+                  for square in iter_bits(bitboard)]
+        return self.probe_pieces(pieces, COLORS.index(board.active_color))
+
+    def best_move(self, board):
+        """Returns the move keeping the best result on board, the quickest mate or slowest loss, or None"""
+        if self.probe(board) is None:
+            return None
+
+        best, best_key = None, None
+        for move in board.generate_legal_moves():
+            undo = board.make_move(*move)
+            result = self.probe(board)
+            board.unmake_move(undo)
+            if result is None:
+                return None
+
+            # the opponent's quickest loss, then a draw, then its slowest win
+            wdl, plies = result
+            key = (-wdl, -plies if wdl == LOSS else plies)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+    def close(self):
+        """Unmaps every loaded table"""
+        for table in self._tables.values():
+            table.close()
+        self._tables = {}
+
+    def _generate(self, signature):
+        start = time.perf_counter()
+        table = Tablebase(signature)
+        values = table.values
+        size = table.size
+
+        # in-table successors not yet known to win, the longest win among those that do,
+        # and whether a draw or a win is already certain, per position
+        remaining = bytearray(size)
+        longest = array('h', bytes(size * 2))
+        safe = bytearray(size)
+        # plies -> positions which may be decided at that many plies
+        candidates = {}
+
+        board = PlayableBoard()
+        board.reset(no_initial_pieces=True)
+        pieces = [Piece(color, ty) for color, ty in table.pieces]
+        placed = [None] * len(pieces)
+        for i in range(size):
+            squares, stm = table.decode(i)
+            if len(set(squares)) < len(squares) or table.index(squares, stm) != i:
+                continue
+
+            # only the pieces which moved since the last position are set up again
+            for n, square in enumerate(squares):
+                if placed[n] is not None and placed[n] != square:
+                    del board[POSITIONS[placed[n]]]
+                    placed[n] = None
+            for n, square in enumerate(squares):
+                if placed[n] is None:
+                    position = POSITIONS[square]
+                    pieces[n].has_moved = pieces[n].type != "pawn" or position not in pieces[n].initial_positions
+                    board[position] = pieces[n]
+                    placed[n] = square
+
+            color = COLORS[stm]
+            board.active_color = color
+            # the side which just moved can't be in check
+            if board.in_check(COLORS[1 - stm]):
+                continue
+
+            values[i] = _UNKNOWN
+            moves = board.generate_move_array()
+            if not moves:
+                if board.in_check(color):
+                    candidates.setdefault(0, array('I')).append(i)
+                # stalemates stay unknown and end up draws
+                continue
+
+            at = {square: n for n, square in enumerate(squares)}
+            successors = set()
+            for move in moves:
+                origin, target, flags = move & 0x3F, move >> 6 & 0x3F, move >> 12
+                n = at[origin]
+                if target not in at and flags < PROMOTION:
+                    moved = list(squares)
+                    moved[n] = target
+                    successors.add(table.index(moved, 1 - stm))
+                    continue
+
+                # captures and promotions lead out of this table
+                after = [(table.pieces[k], square) for k, square in enumerate(squares) if k != n and square != target]
+                ty = PROMOTIONS[flags - PROMOTION] if flags >= PROMOTION else table.pieces[n][1]
+                after.append(((color, ty), target))
+                wdl, plies = self.probe_pieces(after, 1 - stm, generate=True)
+                if wdl == LOSS:
+                    candidates.setdefault(plies + 1, array('I')).append(i)
+                    safe[i] = 1
+                elif wdl == WIN:
+                    longest[i] = max(longest[i], plies)
+                else:
+                    safe[i] = 1
+
+            remaining[i] = len(successors)
+            if not successors and not safe[i]:
+                candidates.setdefault(longest[i] + 1, array('I')).append(i)
+
+        # from the shortest mates up, a loss makes its predecessors wins, and a position
+        # whose successors all turned out to be wins for the opponent is lost
+        plies = 0
+        while candidates:
+            for i in candidates.pop(plies, ()):
+                if values[i] != _UNKNOWN:
+                    continue
+
+                lost = not plies & 1
+                values[i] = -plies - 1 if lost else plies
+                for k in table.predecessors(i):
+                    if values[k] != _UNKNOWN:
+                        continue
+                    if lost:
+                        candidates.setdefault(plies + 1, array('I')).append(k)
+                        continue
+
+                    remaining[k] -= 1
+                    if plies > longest[k]:
+                        longest[k] = plies
+                    if not remaining[k] and not safe[k]:
+                        candidates.setdefault(longest[k] + 1, array('I')).append(k)
+            plies += 1
+
+        for i in range(size):
+            if values[i] == _UNKNOWN:
+                values[i] = DRAW
+
+        logger.info(f"Generated {table.signature} in {time.perf_counter() - start:.1f}s")
+        return table
+
+
+def argparser():
+    parser = argparse.ArgumentParser(prog="pyss tablebase", description="Generates endgame tablebases.")
+    parser.add_argument("signatures", nargs="+",
+                        help="Material signatures, e.g. KQvK KRvK KPvK")
+    parser.add_argument("-d", "--directory", type=str, default="tablebases",
+                        help="Where the tables are saved and looked up")
+
+    return parser
+
+
+def main(argv=None):
+    args = argparser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(name)s | %(message)s")
+
+    tablebases = Tablebases(args.directory)
+    for signature in args.signatures:
+        table = tablebases.generate(signature)
+
+        counts = {WIN: 0, DRAW: 0, LOSS: 0}
+        longest = 0
+        for i in range(table.size):
+            result = _result(table.values[i])
+            if result is not None:
+                counts[result[0]] += 1
+                if result[0] == WIN:
+                    longest = max(longest, result[1])
+        print(f"{table.signature}: {counts[WIN]} won, {counts[DRAW]} drawn, {counts[LOSS]} lost, "
+              f"longest mate {longest} plies")
+
+    tablebases.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,6 @@
-import arcade
 import logging
 import argparse
-
-from .app import ChessApp
+import sys
 
 
 def argparser():
@@ -55,6 +53,17 @@ def argparser():
 
 
 def main():
+    # `pyss perft ...` benchmarks the move generator and `pyss tablebase ...` generates endgames, neither needs a window
+    if sys.argv[1:2] == ["perft"]:
+        from pyss.game.board.depth.perft import main as perft_main
+        sys.exit(perft_main(sys.argv[2:]))
+    if sys.argv[1:2] == ["tablebase"]:
+        from pyss.ai.tablebase import main as tablebase_main
+        sys.exit(tablebase_main(sys.argv[2:]))
+
+    import arcade
+    from .app import ChessApp
+
     args = argparser().parse_args()
 
     logging.basicConfig(level=args.log_level,
@@ -1,17 +1,23 @@
 import os
+import time
 import arcade
 import arcade.gui
 import logging
+from pyss.app.depth_worker import DepthWorker
 from pyss.app.draw_piece import load_pieces
 from pyss.app.theme import ThemeManager
 
 from pyss.app.utils import DEFAULT_THEME
 from ..game.board import Chessboard
+from ..game.board.bitboard import BITS, to_square
 
 
 logger = logging.getLogger(__name__)
 
 
+# seconds per frame spent precomputing moves and drawlists while idle
+PREFETCH_BUDGET = 0.004
+
 
 
 class ChessApp(arcade.Window):
@@ -48,9 +54,19 @@ class ChessApp(arcade.Window):
         # depth selection
         self._depth_bins = {}
         self._depth_drawlists = {}
+        self._depth_footprints = {}
         self._selected_depth_bins = None
         self._selected_depth_moves = None
         self._selected_moves_list = None
+        # deepest background result shown for the selection
+        self._selected_depth_done = None
+        self._depth_worker = DepthWorker()
+        # idle prefetch, positions of the side to move in priority order
+        self._prefetch_queue = []
+        self._prefetch_submitted = set()
+        self._prefetched_moves = {}
+        self._prefetched_moves_lists = {}
+        self._moved_on = {}
 
         # ui
         # self._theme = arcade.gui.Theme()
@@ -94,8 +110,10 @@ class ChessApp(arcade.Window):
         self._reset_depth_bins()
 
         self._turn_count = 1
+        self._moved_on = {}
 
         self.play_board.reset(**board_config)
+        self._queue_prefetch()
 
     def __setup_theme(self):
             self._display_board = self.__create_board()
@@ -115,6 +133,9 @@ class ChessApp(arcade.Window):
             self.__draw_stats()
 
     def update(self, delta_time):
+        self.__collect_depth_jobs()
+        self.__prefetch(PREFETCH_BUDGET)
+
         if delta_time < 1 / 60:
             return
         
@@ -123,6 +144,10 @@ class ChessApp(arcade.Window):
             self.__setup_theme()
             self.theme_manager._reload_required = False
 
+    def on_close(self):
+        self._depth_worker.shutdown()
+        super().on_close()
+
     # access
     def transform(self, i, j):
         """Transforms the given position to another for visual board position."""
@@ -145,6 +170,9 @@ class ChessApp(arcade.Window):
 
     def _reset_selection(self):
         """Resets the selection of a piece."""
+        if self._selected_piece is not None:
+            self._depth_worker.cancel(self._selected_piece)
+
         self._selected_piece = None
         self._old_selected_piece = None
         self._selected_valid_moves = None
@@ -152,11 +180,86 @@ class ChessApp(arcade.Window):
         self._selected_depth_bins = None
         self._selected_depth_moves = None
         self._selected_moves_list = None
+        self._selected_depth_done = None
 
     def _reset_depth_bins(self):
         """Resets the depth bins."""
         self._depth_bins = {}
         self._depth_drawlists = {}
+        self._depth_footprints = {}
+        self._prefetched_moves = {}
+        self._prefetched_moves_lists = {}
+
+        self._depth_worker.cancel()
+
+    def _queue_prefetch(self):
+        """ Queues the pieces that can move next for idle prefetch, most recently moved first.
+
+            Legal moves only hold until the next move, so those are dropped here.
+        """
+        self._prefetched_moves = {}
+        self._prefetched_moves_lists = {}
+
+        colors = [self.play_board.active_color] if self._turns_enabled else ["white", "black"]
+        pieces = [piece_position for color in colors for piece_position in self.play_board.by_color[color]]
+        pieces.sort(key=lambda piece_position: self._moved_on.get(piece_position[0], 0), reverse=True)
+
+        self._prefetch_queue = [position for _, position in pieces]
+        self._prefetch_submitted = set()
+
+    def __prefetch(self, budget):
+        """ Precomputes the moves and drawlists of queued pieces for up to budget seconds.
+
+            Depth bins come from the depth worker, one job at a time and only while it has
+            nothing else to do, so a click never waits behind prefetching.
+        """
+        deadline = time.perf_counter() + budget
+        for position in list(self._prefetch_queue):
+            if time.perf_counter() >= deadline:
+                break
+
+            if not self.play_board[position]:
+                self._prefetch_queue.remove(position)
+            elif self._depth_search:
+                if position in self._depth_bins:
+                    if position not in self._depth_drawlists:
+                        self._depth_drawlists[position] = self.__create_depth_drawlist(self._depth_bins[position])
+                    self._prefetch_queue.remove(position)
+                elif position not in self._prefetch_submitted and not self._depth_worker.busy:
+                    self._depth_worker.submit(self.play_board, position, self._depth_search, rings=False)
+                    self._prefetch_submitted.add(position)
+            else:
+                if not self._prefetched_moves:
+                    for color in {self.play_board[queued].color for queued in self._prefetch_queue}:
+                        self._prefetched_moves.update(self.play_board.get_legal_moves_by_position(color))
+
+                self._prefetched_moves_lists[position] = self.__create_moves_list(
+                    self._prefetched_moves.get(position, []))
+                self._prefetch_queue.remove(position)
+
+    def _repair_depth_bins(self, changed_positions):
+        """ Drops the depth bins a move could have changed and recomputes them in the background.
+
+            A piece's bins only depend on the squares in its footprint, see `Chessboard.depth_footprint`,
+            so bins of pieces the move didn't come near are kept as they are.
+        """
+        # anything computed before the move is stale
+        self._depth_worker.cancel()
+
+        changed = 0
+        for position in changed_positions:
+            changed |= BITS[to_square(position)]
+
+        for position in list(self._depth_bins):
+            if not self._depth_footprints.get(position, changed) & changed:
+                continue
+
+            del self._depth_bins[position]
+            self._depth_drawlists.pop(position, None)
+            self._depth_footprints.pop(position, None)
+
+            if self.play_board[position]:
+                self._depth_worker.submit(self.play_board, position, self._depth_search, rings=False)
 
     # drawing
     def __create_gui(self):
@@ -261,8 +364,8 @@ class ChessApp(arcade.Window):
 
         # update score if turn has changed
         if self.play_board.active_color != self._score_updated_on:
-            self._score_updated = sum([p[0].value for p in self.play_board._by_color["white"]]) - sum(
-                [p[0].value for p in self.play_board._by_color["black"]])
+            self._score_updated = sum([p[0].value for p in self.play_board.by_color["white"]]) - sum(
+                [p[0].value for p in self.play_board.by_color["black"]])
             self._score_updated_on = self.play_board.active_color
 
         # draw score
@@ -271,14 +374,14 @@ class ChessApp(arcade.Window):
         arcade.draw_text(f"Score: {self._score_updated}", *score_offset, self.theme_manager._loaded_theme['stats']['font_color'], self.theme_manager._loaded_theme['stats']['font_size'])
 
         # active pieces count
-        # arcade.draw_text(f"White: {len(self.play_board._by_color['white'])}", 10, 50, FONT_COLOR, FONT_SIZE)
-        # arcade.draw_text(f"Black: {len(self.play_board._by_color['black'])}", 10, 70, FONT_COLOR, FONT_SIZE)
+        # arcade.draw_text(f"White: {len(self.play_board.by_color['white'])}", 10, 50, FONT_COLOR, FONT_SIZE)
+        # arcade.draw_text(f"Black: {len(self.play_board.by_color['black'])}", 10, 70, FONT_COLOR, FONT_SIZE)
         # active piece count
         active_piece_offset = stats_offset[0] - \
             box_size[0] // 4, stats_offset[1] - box_size[1] // 2 + 30
         arcade.draw_text(
-            f"White: {len(self.play_board._by_color['white'])}", *active_piece_offset, self.theme_manager._loaded_theme['stats']['font_color'], self.theme_manager._loaded_theme['stats']['font_size'])
-        arcade.draw_text(f"Black: {len(self.play_board._by_color['black'])}",
+            f"White: {len(self.play_board.by_color['white'])}", *active_piece_offset, self.theme_manager._loaded_theme['stats']['font_color'], self.theme_manager._loaded_theme['stats']['font_size'])
+        arcade.draw_text(f"Black: {len(self.play_board.by_color['black'])}",
                          active_piece_offset[0], active_piece_offset[1] + 20, self.theme_manager._loaded_theme['stats']['font_color'], self.theme_manager._loaded_theme['stats']['font_size'])
 
         # move history
@@ -377,9 +480,6 @@ class ChessApp(arcade.Window):
 
             self._selected_moves_list.draw()
 
-    # def _update_depth_bins(self, changed_positions):
-    #     pass
-
     def __prepare_depth_map(self):
         """ Build and set the depth map for the selected piece.
 
@@ -398,20 +498,15 @@ class ChessApp(arcade.Window):
 
         # if no cached bins, create them
         if self._selected_depth_bins is None:
-            valid_ms = [vms for vms in self._selected_depth_moves if vms[1]]
-            # collect moves by depth, each set of moves is (depth, valid_moves)
-            depth_bins = {}
-            for move in valid_ms:
-                depth = move[0]
-                if depth not in depth_bins:
-                    depth_bins[depth] = []
-                depth_bins[depth].extend(move[1])
+            depth_bins = self.__bin_depth_moves(self._selected_depth_moves)
 
             # cache depth bins
             if self._depth_bins is None:
                 self._depth_bins = {}
 
-            self._depth_bins[self._selected_piece] = depth_bins
+            # only cache once the background jobs are done deepening the bins
+            if not self._depth_worker.pending(self._selected_piece):
+                self.__cache_depth_bins(self._selected_piece, depth_bins)
 
             # force rebuild valid moves
             if self._selected_valid_moves is not None:
@@ -436,21 +531,59 @@ class ChessApp(arcade.Window):
             if depth is not None:
                 self._selected_valid_moves = self._selected_depth_bins[depth]
 
+    def __bin_depth_moves(self, depth_moves):
+        """Collects (depth, valid_moves) into a dict of depth: valid_moves."""
+        depth_bins = {}
+        for depth, valid_moves in depth_moves:
+            if valid_moves:
+                depth_bins.setdefault(depth, []).extend(valid_moves)
+        return depth_bins
+
+    def __cache_depth_bins(self, position, depth_bins):
+        """Caches the complete depth bins of a piece along with the squares they depend on."""
+        self._depth_bins[position] = depth_bins
+        self._depth_footprints[position] = self.play_board.depth_footprint(
+            position, [move for valid_moves in depth_bins.values() for move in valid_moves])
+
+    def __offset_depth_moves(self, depth_moves, depth):
+        """Renumbers (depth, valid_moves) searched to depth as if they were searched to the visual depth"""
+        return [(d + self._depth_search - depth, valid_moves) for d, valid_moves in depth_moves]
+
+    def __collect_depth_jobs(self):
+        """Shows background depth maps of the selected piece as they finish."""
+        for position, depth, depth_moves in self._depth_worker.poll():
+            if position != self._selected_piece:
+                # bins repaired after a move
+                self.__cache_depth_bins(position, self.__bin_depth_moves(depth_moves))
+                self._depth_drawlists.pop(position, None)
+                continue
+
+            if (self._selected_depth_done or 0) >= depth:
+                continue
+
+            self._selected_depth_done = depth
+            self._selected_depth_moves = self.__offset_depth_moves(depth_moves, depth)
+
+            # rebuild the bins and drawlist from the deeper moves
+            self._selected_depth_bins = None
+            self._selected_valid_moves = None
+            self._depth_drawlists.pop(position, None)
+
     def __create_depth_map(self):
         """Create the depth map for the selected piece."""
-        self._depth_drawlists[self._selected_piece] = arcade.ShapeElementList()
+        self._depth_drawlists[self._selected_piece] = self.__create_depth_drawlist(self._selected_depth_bins)
 
-        depth_drawlists = []
-        for i, valid_moves in self._selected_depth_bins.items():
-            color = self.theme_manager._loaded_theme['depth']['color_palette'][(
-                self._depth_search - i) % len(self.theme_manager._loaded_theme['depth']['color_palette'])]
-            drawlist = self.__create_moves_list(
-                valid_moves, color=color, size=(
-                    self._depth_search - i) + 1)
-            depth_drawlists.extend(drawlist)
+    def __create_depth_drawlist(self, depth_bins):
+        """Creates one drawlist of every depth's moves, shallower moves bigger."""
+        palette = self.theme_manager._loaded_theme['depth']['color_palette']
 
-        for s in depth_drawlists:
-            self._depth_drawlists[self._selected_piece].append(s)
+        drawlist = arcade.ShapeElementList()
+        for i, valid_moves in depth_bins.items():
+            color = palette[(self._depth_search - i) % len(palette)]
+            for shape in self.__create_moves_list(valid_moves, color=color, size=(self._depth_search - i) + 1):
+                drawlist.append(shape)
+
+        return drawlist
 
     # GUI interactivity
     def on_mouse_press(self, x, y, button, modifiers):
@@ -474,16 +607,6 @@ class ChessApp(arcade.Window):
                 self._reset_selection()
                 return
 
-            # only king can move if check
-            if self.play_board._check:
-                if selection.type != 'king':
-                    self._reset_selection()
-                    return
-                else:
-                    # TODO: other pieces can move if they can block check
-                    # TODO: king can move, but not into another check, if no available moves - checkmate
-                    pass
-
             # toggle selection
             if self._selected_piece == (i, j):
                 self._reset_selection()
@@ -494,14 +617,22 @@ class ChessApp(arcade.Window):
 
             # get valid moves
             if self._depth_search:
-                # Depth is recursive over .valid_moves()
-                if self._selected_depth_moves is None:
-                    self._selected_depth_moves = self.play_board.all_valid_moves_to_depth(
-                        self._selected_piece, depth=self._depth_search)
+                # the piece's own moves are shown right away, deeper rings are computed in the
+                # background on a snapshot of the board and picked up in update()
+                self._selected_depth_moves = self.__offset_depth_moves(
+                    self.play_board.all_valid_moves_to_depth(self._selected_piece, depth=0), 0)
+                if self._selected_piece not in self._depth_bins:
+                    # a repair job for the piece is superseded by the rings
+                    self._depth_worker.cancel(self._selected_piece)
+                    self._depth_worker.submit(self.play_board, self._selected_piece, self._depth_search)
             else:
-                # Depth is 0, so just get valid moves
-                self._selected_valid_moves = self.play_board.get_valid_moves(
-                    self._selected_piece)
+                # Depth is 0, so just get legal moves, which handle check and pins
+                if self._prefetched_moves:
+                    self._selected_valid_moves = self._prefetched_moves.get(self._selected_piece, [])
+                    self._selected_moves_list = self._prefetched_moves_lists.get(self._selected_piece)
+                else:
+                    self._selected_valid_moves = self.play_board.get_legal_moves(
+                        self._selected_piece)
         else:
             self._reset_selection()
 
@@ -516,21 +647,24 @@ class ChessApp(arcade.Window):
         else:
             return False
 
-        # if the attempted click is a valid move, try to make it
-        if (i, j) in selected_valid_moves:
+        # if the attempted click is a valid move, and legal (depth maps don't account for check), try to make it
+        if (i, j) in selected_valid_moves and (i, j) in self.play_board.get_legal_moves(self._selected_piece):
             other = self.play_board[i, j]
             # king check is a hack because for some reason selecting it swaps the turn - probably because you can't capture it
             if other and other.type == "king" and other.color != self.play_board.active_color:
                 return False
 
             if (i, j) != self._selected_piece:
-                self.play_board.move(self._selected_piece, (i, j), update=True)
-                # self._update_depth_bins([self.selected_piece, (i, j)])
-                self._reset_depth_bins()  # TODO: rebuild instead
+                undo = self.play_board.move(self._selected_piece, (i, j), update=True)
+                self._repair_depth_bins(self.play_board.changed_positions(undo))
+                for piece, _ in undo.has_moved:
+                    self._moved_on[piece] = self._turn_count
 
                 # next turn
                 if self._turns_enabled:
                     self._turn_count += 1
                     self.play_board.active_color = "black" if self.play_board.active_color == "white" else "white"
 
+                self._queue_prefetch()
+
                 return True
@@ -0,0 +1,132 @@
+""" Computes depth maps in a background process so the window never waits on them.
+
+    Jobs work on a pickled snapshot of the board taken when they are submitted.
+    A job searches once to its full depth and sends each level back as soon as
+    it is done, so shallow rings are ready long before the deep ones.
+"""
+import itertools
+import logging
+import multiprocessing
+import pickle
+from queue import Empty
+
+
+logger = logging.getLogger(__name__)
+
+
+# where a worker process sends the levels of its jobs, set up when the pool starts
+_levels = None
+
+
+def _init_worker(levels):
+    global _levels
+    _levels = levels
+
+
+def _depth_job(job_id, snapshot, position, depth, rings):
+    depth_moves = []
+    for level in pickle.loads(snapshot).iter_valid_moves_to_depth(position, depth=depth):
+        depth_moves.append(level)
+        if rings:
+            _levels.put((job_id, level))
+    return depth_moves
+
+
+class DepthWorker:
+    def __init__(self, processes=1, context="spawn"):
+        self.processes = processes
+        # spawned, not forked, so nothing of the window's GL state ends up in the workers
+        self._context = multiprocessing.get_context(context)
+        self._pool = None
+        self._levels = None
+        self._ids = itertools.count()
+
+        # [job id, position, depth, rings, snapshot, levels received, AsyncResult] in submission order
+        self._jobs = []
+
+    @property
+    def busy(self):
+        """Returns True while submitted jobs are unfinished or not yet polled"""
+        return bool(self._jobs)
+
+    def pending(self, position):
+        """Returns True while jobs for position are unfinished or not yet polled"""
+        return any(job[1] == position for job in self._jobs)
+
+    def submit(self, board, position, depth, rings=True):
+        """ Queues the depth map of the piece at position.
+
+            With rings each depth from 1 up to depth is also reported as the search gets
+            there, so the shallow ones can be shown first, otherwise only depth itself is.
+        """
+        # the pool pickles arguments later on its own thread, so the snapshot is taken here
+        snapshot = pickle.dumps(board)
+        job_id = next(self._ids)
+        self._jobs.append([job_id, position, depth, rings, snapshot, [],
+                           self._apply(job_id, snapshot, position, depth, rings)])
+
+    def _apply(self, job_id, snapshot, position, depth, rings):
+        if self._pool is None:
+            self._levels = self._context.Queue()
+            self._pool = self._context.Pool(self.processes, initializer=_init_worker, initargs=(self._levels,))
+        return self._pool.apply_async(_depth_job, (job_id, snapshot, position, depth, rings))
+
+    def poll(self):
+        """Returns (position, depth, depth_moves) for each ring and job finished since the last poll"""
+        finished = []
+        jobs = {job[0]: job for job in self._jobs}
+        while self._levels is not None:
+            try:
+                job_id, level = self._levels.get_nowait()
+            except Empty:
+                break
+            job = jobs.get(job_id)
+            if job is None:
+                # the job was cancelled, or its full map was already reported
+                continue
+
+            _, position, depth, _, _, levels, _ = job
+            levels.append(level)
+            ring = len(levels) - 1
+            if 0 < ring < depth:
+                # labelled as if searched to the ring's depth, like a search stopped there
+                finished.append((position, ring, [(d - depth + ring, moves) for d, moves in levels]))
+
+        for job in list(self._jobs):
+            _, position, depth, _, _, _, result = job
+            if not result.ready():
+                continue
+
+            self._jobs.remove(job)
+            try:
+                finished.append((position, depth, result.get()))
+            except Exception as e:
+                logger.warning(f"Depth job for {position} at depth {depth} failed: {e!r}")
+
+        return finished
+
+    def cancel(self, position=None):
+        """Drops the jobs for position, or every job, restarting the pool if one of them is still running"""
+        dropped = [job for job in self._jobs if position is None or job[1] == position]
+        self._jobs = [job for job in self._jobs if job not in dropped]
+
+        if any(not job[6].ready() for job in dropped):
+            # a running job can't be interrupted, its process can, the jobs kept are queued again
+            self._restart()
+            for job in self._jobs:
+                if not job[6].ready():
+                    job_id, job_position, depth, rings, snapshot, levels, _ = job
+                    levels.clear()
+                    job[6] = self._apply(job_id, snapshot, job_position, depth, rings)
+
+    def _restart(self):
+        # a process killed while sending can leave the queue unusable, so it goes with the pool
+        self._pool.terminate()
+        self._levels.close()
+        self._pool = self._levels = None
+
+    def shutdown(self):
+        """Stops the worker processes"""
+        if self._pool is not None:
+            self._restart()
+        self._jobs = []
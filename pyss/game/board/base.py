@@ -3,6 +3,8 @@ import logging
 
 from functools import lru_cache
 
+from pyss.game.board.bitboard import BITS, between, empty_bitboards, to_square
+from pyss.game.board.zobrist import PIECE_KEYS
 from pyss.game.notation import generate_notation
 from pyss.game.piece import piece_dict, Piece
 
@@ -16,6 +18,9 @@ class BaseBoard:
         - 8x8 grid of alternating black and white squares
         - 16 pieces per player
         - 2 players
+
+        Alongside the 8x8 grid of `Piece` objects the board keeps one 64-bit
+        occupancy int per color and piece type, see `pyss.game.board.bitboard`.
     """
 
     def __init__(self, initialize=True):
@@ -24,6 +29,10 @@ class BaseBoard:
         self._active_pieces = None
         self._by_color = None
 
+        self._bitboards = None
+        self._occupancy = None
+        self._zobrist = 0
+
         if initialize:
             self.reset()
 
@@ -92,22 +101,59 @@ class BaseBoard:
 
     @property
     def by_color(self):
-        """Returns a dictionary of the active pieces on the board"""
-        return self._by_color
+        """Returns live views of the active (piece, position) pairs of each color"""
+        return {color: pieces.items() for color, pieces in self._by_color.items()}
+
+    @property
+    def bitboards(self):
+        """Returns the occupancy bitboards keyed by color then piece type"""
+        return self._bitboards
+
+    @property
+    def occupancy(self):
+        """Returns the occupancy bitboard of each color"""
+        return self._occupancy
+
+    @property
+    def occupied(self):
+        """Returns the occupancy bitboard of both colors"""
+        return self._occupancy['white'] | self._occupancy['black']
+
+    @property
+    def zobrist_key(self):
+        """Returns the 64-bit Zobrist key of the position, maintained incrementally"""
+        return self._zobrist
+
+    def compute_zobrist_key(self):
+        """Computes the Zobrist key of the position from scratch."""
+        key = 0
+        for piece, position in self._active_pieces.items():
+            key ^= PIECE_KEYS[piece.color][piece.type][to_square(position)]
+        return key
 
     def __init_active_pieces(self):
         """Updates the active pieces on the board"""
 
         pieces = {}
-        by_color = {'white': [], 'black': []}
+        by_color = {'white': {}, 'black': {}}
+        bitboards = empty_bitboards()
+        occupancy = {'white': 0, 'black': 0}
         for i, row in enumerate(self.board):
             for j, piece in enumerate(row):
                 if piece:
                     pieces[piece] = (i, j)
-                    by_color[piece.color].append((piece, (i, j)))
+                    by_color[piece.color][piece] = (i, j)
 
+                    bit = BITS[j * 8 + i]
+                    bitboards[piece.color][piece.type] |= bit
+                    occupancy[piece.color] |= bit
+
+        # piece -> position per color, so pieces can be removed in constant time
         self._by_color = by_color
         self._active_pieces = pieces
+        self._bitboards = bitboards
+        self._occupancy = occupancy
+        self._zobrist = BaseBoard.compute_zobrist_key(self)
 
     def board_safe(self, position, new_position):
         """Checks if a move is valid between two locations on the board."""
@@ -120,48 +166,27 @@ class BaseBoard:
             return False
 
         # check if move is to an occupied square by same team
-        dest_piece = self[new_position]
-        moving_piece = self[position]
-        if dest_piece and moving_piece and dest_piece.color == moving_piece.color:
+        moving_piece = self.board[position[0]][position[1]]
+        if moving_piece and self._occupancy[moving_piece.color] & BITS[new_position[1] * 8 + new_position[0]]:
             return False
 
         return True
 
     def check_path(self, position, new_position, castling=False):
         """ Returns true if there are no pieces in a straight line between two positions. """
-        # get the direction of the move
-        direction = (
-            new_position[0] -
-            position[0],
-            new_position[1] -
-            position[1])
-
-        # get the number of spaces between the two positions
-        distance = max(abs(direction[0]), abs(direction[1]))
-
-        # check if the path is clear
-        seen_enemy = False
-        for i in range(distance):
-            # get the position of the next space in the path
-            next_position = (position[0] +
-                             (i + 1) * direction[0] // distance,
-                             position[1] +
-                             (i + 1) * direction[1] // distance)
-
-            # check if the space is occupied by a friendly piece
-            next_piece = self[next_position]
-            moving_piece = self[position]
-            if next_piece and moving_piece and next_piece.compare_color(moving_piece) and\
-                    next_piece.type not in ["king", "rook"] and not castling:
-                return False
-            # if it's an enemy piece, check if we've already seen one or set
-            # that we have
-            elif next_piece:
-                if seen_enemy:
-                    return False
-                seen_enemy = True
-            elif seen_enemy:
-                return False
+        if position == new_position:
+            return True
+
+        # every square strictly between the two positions must be empty
+        if between(position, new_position) & self.occupied:
+            return False
+
+        # the destination may only hold a friendly piece when it's a king or rook
+        next_piece = self.board[new_position[0]][new_position[1]]
+        moving_piece = self.board[position[0]][position[1]]
+        if next_piece and moving_piece and next_piece.compare_color(moving_piece) and\
+                next_piece.type not in ["king", "rook"] and not castling:
+            return False
 
         return True
 
@@ -176,12 +201,17 @@ class BaseBoard:
 
     def __delitem__(self, key):
         """Removes a piece from the board"""
-        # find piece in active pieces
-        for item in self._active_pieces.items():
-            if item[1] == key:
-                del self._active_pieces[item[0]]
-                self._by_color[self[item[1]].color].remove(item)
-                break
+        # the grid maps squares to pieces, the piece indexes are keyed by piece
+        piece = self.board[key[0]][key[1]]
+        if piece:
+            del self._active_pieces[piece]
+            del self._by_color[piece.color][piece]
+
+            square = to_square(key)
+            mask = ~BITS[square]
+            self._bitboards[piece.color][piece.type] &= mask
+            self._occupancy[piece.color] &= mask
+            self._zobrist ^= PIECE_KEYS[piece.color][piece.type][square]
 
         self.board[key[0]][key[1]] = None
 
@@ -193,4 +223,10 @@ class BaseBoard:
 
         self.board[key[0]][key[1]] = value
         self._active_pieces[value] = key
-        self._by_color[value.color].append((value, key))
+        self._by_color[value.color][value] = key
+
+        square = to_square(key)
+        bit = BITS[square]
+        self._bitboards[value.color][value.type] |= bit
+        self._occupancy[value.color] |= bit
+        self._zobrist ^= PIECE_KEYS[value.color][value.type][square]
@@ -0,0 +1,86 @@
+""" Bitboard primitives used by the board backend.
+
+    Squares are numbered rank-major from white's side: a1 = 0, h1 = 7, a8 = 56.
+    A board position `(file, rank)` therefore maps to `rank * 8 + file`.
+"""
+from functools import lru_cache
+
+
+COLORS = ("white", "black")
+TYPES = ("pawn", "knight", "bishop", "rook", "queen", "king")
+
+FULL = 0xFFFF_FFFF_FFFF_FFFF
+
+POSITIONS = tuple((square & 7, square >> 3) for square in range(64))
+BITS = tuple(1 << square for square in range(64))
+
+
+def to_square(position):
+    """Returns the square index of a (file, rank) position."""
+    return position[1] * 8 + position[0]
+
+
+def to_position(square):
+    """Returns the (file, rank) position of a square index."""
+    return POSITIONS[square]
+
+
+def iter_bits(bitboard):
+    """Yields the square index of every set bit, lowest first."""
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+
+def lsb(bitboard):
+    """Returns the square index of the lowest set bit."""
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bitboard):
+        """Returns the number of set bits."""
+        return bin(bitboard).count("1")
+
+
+@lru_cache(maxsize=None)
+def between(position, new_position):
+    """Returns a mask of the squares strictly between two positions.
+
+        Steps the same way `BaseBoard.check_path` always has, so unaligned
+        pairs produce the same squares they used to.
+    """
+    direction = (new_position[0] - position[0], new_position[1] - position[1])
+    distance = max(abs(direction[0]), abs(direction[1]))
+
+    mask = 0
+    for i in range(1, distance):
+        mask |= BITS[to_square((position[0] + i * direction[0] // distance,
+                                position[1] + i * direction[1] // distance))]
+    return mask
+
+
+def _build_between():
+    table = [0] * 4096
+    for square in range(64):
+        x, y = POSITIONS[square]
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            mask = 0
+            nx, ny = x + dx, y + dy
+            while 0 <= nx <= 7 and 0 <= ny <= 7:
+                table[square * 64 + ny * 8 + nx] = mask
+                mask |= BITS[ny * 8 + nx]
+                nx, ny = nx + dx, ny + dy
+    return table
+
+
+# BETWEEN[a * 64 + b] is the mask strictly between two squares on a line, else 0
+BETWEEN = _build_between()
+
+
+def empty_bitboards():
+    """Returns one empty bitboard per color and piece type."""
+    return {color: {ty: 0 for ty in TYPES} for color in COLORS}
@@ -1,69 +1,236 @@
+import time
+
+from ..bitboard import BETWEEN, BITS, to_square
+from ..magic import LINE_KINDS, slider_attacks
+from ..moves import MOVES
 from ..playable import PlayableBoard
-from .tree import DepthNode, MoveTree
+from ..tables import ATTACKS, CASTLING, PAWN_DOUBLE_STEPS, PROMOTION_RANKS, STEPS
+from ..zobrist import en_passant_key
+from .transposition import TranspositionTable
+from .tree import MoveCursor, MoveTree, transposition_mb
 
 
 class Chessboard(PlayableBoard):
-    def __init__(self, initialize=True):
+    def __init__(self, initialize=True, hash_mb=16):
         super().__init__(initialize)
 
         self._move_tree = { 'white': None, 'black': None }
 
-    def valid_move_tree(self, depth=3, tree=None):
-        """Returns a tree of valid moves for the current player."""
-        if depth < 0:
-            return tree
-        
+        self.hash_mb = hash_mb
+        self._transposition_table = None
+
+    def __getstate__(self):
+        # sent to other processes without the caches, they are rebuilt on use
+        state = self.__dict__.copy()
+        state["_move_tree"] = {'white': None, 'black': None}
+        state["_transposition_table"] = None
+        return state
+
+    @property
+    def transposition_table(self):
+        """Returns the transposition table for searches on this board, allocated on first use"""
+        if self._transposition_table is None:
+            self._transposition_table = TranspositionTable(self.hash_mb)
+        return self._transposition_table
+
+    def valid_move_tree(self, depth=3, nodes=None, time_limit=None):
+        """ Returns a tree of valid moves for the current player, built from `walk_valid_moves`.
+
+            With a nodes or time_limit budget the tree may come back partial, calling
+            again with the same depth goes on from where the last call stopped.
+            Positions the tree already expanded at least as deep, e.g. reached through
+            another move order, are added as leaves instead of being expanded again.
+        """
+        tree = self._move_tree[self.active_color]
+        if tree is not None:
+            cursor = tree.cursor
+            if cursor.key != self.zobrist_key or cursor.depth < depth or (not cursor.done and cursor.depth != depth):
+                tree = None
+
         if tree is None:
-            if self._move_tree[self.active_color] is not None:
-                tree = self._move_tree[self.active_color]
+            # the table is sized for the walk, a small tree shouldn't carry a full search table
+            tree = MoveTree(self, hash_mb=transposition_mb(depth, self.hash_mb))
+            self._move_tree[self.active_color] = tree
+
+        # the walk is depth first, so a record's parent is the last node added one level up
+        spine = tree._spine
+        for _, path, move in self.walk_valid_moves(depth, nodes, time_limit, cursor=tree.cursor):
+            del spine[len(path) + 1:]
+            spine.append(tree.add_move(move, spine[len(path)]))
+
+        return tree
+
+    def walk_valid_moves(self, depth=3, nodes=None, time_limit=None, cursor=None):
+        """ Yields (depth, path, move) for the valid move tree of the current player, depth first.
+
+            path is the moves leading to move, both as `make_move` tuples, and depth counts
+            down to 0 for the last level like `all_valid_moves_to_depth`. The walk stops after
+            nodes records or time_limit seconds, pass the same MoveCursor again to resume it.
+            A cursor with transpositions expands each position only once.
+        """
+        if cursor is None:
+            cursor = MoveCursor()
+
+        if not cursor.started:
+            cursor.key, cursor.depth = self.zobrist_key, depth
+            if depth >= 0:
+                self.__push_moves(cursor, depth, ())
+        elif cursor.key != self.zobrist_key:
+            raise ValueError("The cursor was started from another position")
+
+        deadline = time.perf_counter() + time_limit if time_limit is not None else None
+        stack = cursor.stack
+        count = 0
+        while stack:
+            if nodes is not None and count >= nodes:
+                return
+            if deadline is not None and not count & 63 and time.perf_counter() >= deadline:
+                return
+
+            level, path, move = stack.pop()
+            if level > 0:
+                self.__push_moves(cursor, level - 1, path + (move,))
+
+            count += 1
+            cursor.nodes += 1
+            yield level, tuple(MOVES[code] for code in path), MOVES[move]
+
+    def __push_moves(self, cursor, level, path):
+        """Pushes the moves after path onto the cursor, unless the position was expanded as deep before."""
+        undos = [self.make_move(*MOVES[code]) for code in path]
+
+        transpositions = cursor.transpositions
+        entry = transpositions.probe(self.zobrist_key) if transpositions is not None else None
+        if entry is None or entry[0] < level:
+            if transpositions is not None:
+                transpositions.store(self.zobrist_key, level)
+            # reversed, so they are popped in the order they were generated
+            cursor.stack.extend((level, path, move) for move in reversed(self.generate_move_array()))
+
+        for undo in reversed(undos):
+            self.unmake_move(undo)
+
+    def perft(self, depth):
+        """Returns the number of legal move sequences depth plies long from this position."""
+        if depth <= 0:
+            return 1
+
+        moves = self.generate_move_array()
+        if depth == 1:
+            return len(moves)
+
+        nodes = 0
+        for move in moves:
+            undo = self.make_move(*MOVES[move])
+            nodes += self.perft(depth - 1)
+            self.unmake_move(undo)
+
+        return nodes
+
+    def perft_divide(self, depth):
+        """Returns the perft count below each legal move of the current player."""
+        divide = {}
+        for move in self.generate_legal_moves():
+            undo = self.make_move(*move)
+            divide[move] = self.perft(depth - 1)
+            self.unmake_move(undo)
+
+        return divide
+
+    def all_valid_moves_to_depth(self, position, depth=3):
+        """ Returns [(depth, valid_moves), ...] of the squares the piece at position reaches,
+            one more move per level, the level of its own valid moves labelled depth and the last 0.
+
+            The piece moves alone, the turn is handed back after each move, in a level by level
+            breadth-first search. A position is expanded only the first time any level reaches
+            it, keyed by the board's Zobrist key which covers the piece's square and whatever
+            it captured or changed on the way, so each level only holds newly reached squares.
+            The en passant square is left out of the key, only the first level can use it.
+        """
+        return list(self.iter_valid_moves_to_depth(position, depth))
+
+    def iter_valid_moves_to_depth(self, position, depth=3):
+        """Yields the levels of `all_valid_moves_to_depth` one at a time, the board is as it was between them."""
+        piece = self[position]
+        if not piece or depth < 0:
+            return
+
+        visited = {self.zobrist_key ^ en_passant_key(self.en_passant_available)}
+        # paths of (position, new_position) from the root to each newly reached position
+        frontier = [()]
+        for level in range(depth, -1, -1):
+            reached = set()
+            next_frontier = []
+            for path in frontier:
+                undos = [self.__make_own_move(*move) for move in path]
+                current = self.active_pieces.get(piece, path[-1][1]) if path else position
+
+                for move in self.get_valid_moves(current):
+                    undo = self.__make_own_move(current, move)
+                    if undo is None:
+                        continue
+
+                    key = self.zobrist_key ^ en_passant_key(self.en_passant_available)
+                    if key not in visited:
+                        visited.add(key)
+                        reached.add(move)
+                        next_frontier.append(path + ((current, move),))
+
+                    self.unmake_move(undo)
+
+                for undo in reversed(undos):
+                    self.unmake_move(undo)
+
+            # once nothing new is reached the remaining levels stay empty, but are still listed
+            yield level, sorted(reached)
+            frontier = next_frontier
+
+    def __make_own_move(self, position, new_position):
+        """Makes a move and hands the turn back, so the same side keeps moving."""
+        undo = self.make_move(position, new_position)
+        if undo is not None:
+            self.active_color = undo.active_color
+        return undo
+
+    def depth_footprint(self, position, reachable):
+        """ Returns a bitboard of the squares whose contents can change what
+            `all_valid_moves_to_depth` finds for the piece at position.
+
+            That is every square the piece could move to or through on an empty board, from
+            position or any of the reachable positions, plus its castling squares. A move
+            touching none of them leaves the piece's depth moves as they were.
+        """
+        piece = self[position]
+        if not piece:
+            return 0
+
+        footprint = 0
+        for x, y in set(reachable) | {position}:
+            square = to_square((x, y))
+            footprint |= BITS[square]
+
+            ty = piece.type
+            # a pawn keeps going as a queen once it promotes
+            if ty == "pawn" and y == PROMOTION_RANKS[piece.color]:
+                ty = "queen"
+
+            if ty in LINE_KINDS:
+                footprint |= slider_attacks(ty, square, 0)
+            elif ty == "pawn":
+                for target in STEPS["pawn"][piece.color][square] + PAWN_DOUBLE_STEPS[piece.color][square]:
+                    footprint |= BITS[target]
+                footprint |= ATTACKS["pawn"][piece.color][square]
+                # the pawns it could take en passant
+                for side in (x - 1, x + 1):
+                    if 0 <= side <= 7:
+                        footprint |= BITS[to_square((side, y))]
             else:
-                tree = MoveTree(self)
-                self._move_tree[self.active_color] = tree
-
-
-        for piece in self.by_color[self.active_color]:
-            moves = self.get_valid_moves(piece[1])
-            node = DepthNode(parent=tree._current_node)
-            tree.add_move(None, node)
-            for move in moves:
-                tree.add_move(move, node)
-
-                # simulate move - we don't use getters/setters here because we don't want to update the board
-                move_piece = self[move]
-                self.board[piece[1][0]][piece[1][1]] = None
-                self.board[move[0]][move[1]] = piece[0]
-
-                # check valid moves for piece
-                self.valid_move_tree(depth=depth - 1, tree=tree)
-
-                # undo move
-                self.board[piece[1][0]][piece[1][1]] = piece[0]
-                self.board[move[0]][move[1]] = move_piece
-
-    def all_valid_moves_to_depth(self, position, depth=3, all_valid_moves=None):
-        """Returns a list of valid moves for a piece to a given depth. (max=3) """
-        if all_valid_moves is None:
-            all_valid_moves = []
-
-        original_piece = self[position]
-        if not original_piece or depth < 0:
-            return all_valid_moves
-
-        # check valid moves for piece
-        valid_moves = self.get_valid_moves(position)
-        all_valid_moves.append((depth, valid_moves))
-        for move in valid_moves:
-            # simulate move - we don't use getters/setters here because we don't want to update the board
-            move_piece = self[move]
-            self.board[move[0]][move[1]] = original_piece
-
-            # check valid moves for piece
-            self.board[position[0]][position[1]] = None
-            self.all_valid_moves_to_depth(
-                move, depth=depth - 1, all_valid_moves=all_valid_moves)
-
-            # undo move
-            self.board[move[0]][move[1]] = move_piece
-            self.board[position[0]][position[1]] = original_piece
-
-        return all_valid_moves
+                footprint |= ATTACKS[ty][piece.color][square]
+
+            if ty == "king":
+                for color, king_position, rook_position in CASTLING:
+                    if color == piece.color and (x, y) == king_position:
+                        rook_square = to_square(rook_position)
+                        footprint |= BETWEEN[square * 64 + rook_square] | BITS[rook_square]
+
+        return footprint
@@ -0,0 +1,153 @@
+""" Perft, the number of leaf nodes of the legal move tree, for checking and timing move generation.
+
+    Usage:
+        pyss perft -d 4
+        pyss perft -d 3 --fen "<fen>" --divide -j 4
+        pyss perft --suite -d 3
+        pyss perft --epd perftsuite.epd -d 3
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pyss.game.board.depth.depth import Chessboard
+from pyss.game.board.fen import STARTING_FEN, load_fen, read_epd
+from pyss.game.notation import long_algebraic
+
+
+# (name, fen, expected node counts from depth 1 up), from the Chess Programming Wiki
+REFERENCE_POSITIONS = (
+    ("initial", STARTING_FEN,
+     (20, 400, 8902, 197281, 4865609, 119060324)),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     (48, 2039, 97862, 4085603, 193690690)),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     (14, 191, 2812, 43238, 674624, 11030083)),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     (6, 264, 9467, 422333, 15833292)),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     (44, 1486, 62379, 2103487, 89941194)),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     (46, 2079, 89890, 3894594, 164075551)),
+    ("en passant", "8/8/8/2k5/2pP4/8/B7/4K3 b - d3 0 3",
+     (8, 72, 492, 5380)),
+)
+
+
+def move_to_uci(board, move):
+    """ Returns a move of board in long algebraic notation.
+
+        Castles are made by moving the king onto its rook, they are written
+        as the usual two square king step so divides compare with other engines.
+    """
+    position, new_position = move[:2]
+    piece, other = board[position], board[new_position]
+    if other and other.color == piece.color:
+        king, rook = (position, new_position) if piece.type == "king" else (new_position, position)
+        position, new_position = king, (6 if rook[0] > king[0] else 2, king[1])
+
+    return long_algebraic(position, new_position, *move[2:])
+
+
+def _perft_root(job):
+    fen, move, depth = job
+    board = load_fen(Chessboard(), fen)
+    board.make_move(*move)
+    return board.perft(depth - 1)
+
+
+def perft(fen=STARTING_FEN, depth=3, processes=None):
+    """ Returns (nodes, divide, seconds) for a position searched to depth.
+
+        divide maps each root move, in long algebraic notation, to its node count.
+        With processes > 1 the root moves are split over a process pool.
+    """
+    board = load_fen(Chessboard(), fen)
+
+    start = time.perf_counter()
+    if depth < 1:
+        divide = {}
+    elif processes and processes > 1:
+        moves = board.generate_legal_moves()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            counts = pool.map(_perft_root, [(fen, move, depth) for move in moves])
+            divide = dict(zip(moves, counts))
+    else:
+        divide = board.perft_divide(depth)
+    seconds = time.perf_counter() - start
+
+    nodes = sum(divide.values()) if depth >= 1 else 1
+    return nodes, {move_to_uci(board, move): count for move, count in divide.items()}, seconds
+
+
+def _report(nodes, seconds):
+    return f"{nodes} nodes in {seconds:.2f}s ({int(nodes / seconds) if seconds else 0} nps)"
+
+
+def argparser():
+    parser = argparse.ArgumentParser(prog="pyss perft", description="Counts the leaf nodes of the legal move tree.")
+    parser.add_argument("-d", "--depth", type=int, default=3,
+                        help="Depth in plies")
+    parser.add_argument("-f", "--fen", type=str, default=STARTING_FEN,
+                        help="Position to search")
+    parser.add_argument("-dv", "--divide", action="store_true", default=False,
+                        help="Print the node count below each root move")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="Split the root moves over a process pool")
+    parser.add_argument("-s", "--suite", action="store_true", default=False,
+                        help="Check the reference positions up to depth")
+    parser.add_argument("-e", "--epd", type=str, default=None,
+                        help="Check the positions of an EPD file with D1, D2, ... node counts up to depth")
+
+    return parser
+
+
+def _epd_positions(path):
+    for number, (board, operations) in enumerate(read_epd(path), 1):
+        counts = {int(opcode[1:]): int(operands[0]) for opcode, operands in operations.items()
+                  if opcode[:1] == "D" and opcode[1:].isdigit() and operands}
+        yield (operations.get("id") or [f"#{number}"])[0], board.to_fen(), counts
+
+
+def _check(positions, max_depth, processes):
+    """Runs perft on (name, fen, {depth: expected count}) up to max_depth, returns the number of failures"""
+    failed = 0
+    total_nodes, total_seconds = 0, 0.0
+    for name, fen, expected in positions:
+        for depth, count in sorted(expected.items()):
+            if depth > max_depth:
+                break
+            nodes, _, seconds = perft(fen, depth, processes)
+            total_nodes += nodes
+            total_seconds += seconds
+
+            status = "ok" if nodes == count else f"FAILED, expected {count}"
+            failed += nodes != count
+            print(f"{name} depth {depth}: {_report(nodes, seconds)} {status}")
+
+    print(f"total: {_report(total_nodes, total_seconds)}")
+    return failed
+
+
+def main(argv=None):
+    args = argparser().parse_args(argv)
+
+    if args.suite or args.epd:
+        if args.epd:
+            positions = _epd_positions(args.epd)
+        else:
+            positions = ((name, fen, dict(enumerate(expected, 1))) for name, fen, expected in REFERENCE_POSITIONS)
+        return 1 if _check(positions, args.depth, args.processes) else 0
+
+    nodes, divide, seconds = perft(args.fen, args.depth, args.processes)
+    if args.divide:
+        for move, count in sorted(divide.items()):
+            print(f"{move}: {count}")
+        print()
+    print(_report(nodes, seconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
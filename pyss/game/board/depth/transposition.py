@@ -0,0 +1,107 @@
+from array import array
+
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+_VALUE_OFFSET = 1 << 31
+
+
+def _buckets(mb):
+    buckets = 1
+    while buckets * 2 * 2 * 8 * 2 <= mb * 1024 * 1024:
+        buckets *= 2
+    return buckets
+
+
+class TranspositionTable:
+    """ A fixed-size table of search results keyed by Zobrist position key.
+
+        Entries live in two parallel `array('Q')` columns, the key and one packed
+        word of (move: 16, depth + 1: 8, flag: 2, value: 32) bits. Keys hash to a
+        bucket of two slots: the first keeps the deepest result seen for the
+        bucket, the second is overwritten by everything else.
+
+        The columns can instead live in a shared buffer (see `nbytes`) so several
+        processes search with one table. The key column then holds key ^ data, so
+        an entry torn by two processes writing at once no longer matches its key.
+    """
+
+    def __init__(self, mb=16, buffer=None):
+        self.mb = mb
+
+        buckets = _buckets(mb)
+        self._mask = buckets - 1
+
+        self._views = []
+        if buffer is None:
+            self._keys = array('Q', bytes(buckets * 2 * 8))
+            self._data = array('Q', bytes(buckets * 2 * 8))
+        else:
+            raw = memoryview(buffer)[:self.nbytes(mb)]
+            words = raw.cast('Q')
+            self._keys = words[:buckets * 2]
+            self._data = words[buckets * 2:]
+            self._views = [self._keys, self._data, words, raw]
+
+    @staticmethod
+    def nbytes(mb=16):
+        """Returns the size of the buffer a table of mb megabytes needs"""
+        return _buckets(mb) * 2 * 8 * 2
+
+    def __len__(self):
+        """Returns the number of slots"""
+        return len(self._keys)
+
+    def __deepcopy__(self, memo):
+        # entries only depend on the position key, so board copies can share them
+        return self
+
+    def close(self):
+        """Lets go of a shared buffer, the table can't be used afterwards"""
+        for view in self._views:
+            view.release()
+        self._views = []
+
+    def clear(self):
+        """Empties every slot"""
+        if self._views:
+            self._views[-1][:] = bytes(len(self._views[-1]))
+            return
+        self._keys = array('Q', bytes(len(self._keys) * 8))
+        self._data = array('Q', bytes(len(self._data) * 8))
+
+    def store(self, key, depth, value=0, flag=EXACT, move=0):
+        """Stores a search result for a position searched to depth."""
+        slot = (key & self._mask) << 1
+        data = self._data[slot]
+        stored = self._keys[slot] ^ data
+        if stored == key or not data or depth >= (data >> 16 & 0xFF) - 1:
+            # depth-preferred slot, its old entry moves to the always-replace slot
+            if data and stored != key:
+                self._keys[slot + 1] = self._keys[slot]
+                self._data[slot + 1] = data
+        else:
+            slot += 1
+
+        data = (move & 0xFFFF) | (min(depth, 254) + 1) << 16 | flag << 24 | (value + _VALUE_OFFSET) << 26
+        self._keys[slot] = key ^ data
+        self._data[slot] = data
+
+    def probe(self, key):
+        """Returns (depth, value, flag, move) stored for a position, or None."""
+        slot = (key & self._mask) << 1
+        data = self._data[slot]
+        if self._keys[slot] ^ data != key or not data:
+            slot += 1
+            data = self._data[slot]
+            if self._keys[slot] ^ data != key or not data:
+                return None
+
+        return (data >> 16 & 0xFF) - 1, (data >> 26) - _VALUE_OFFSET, data >> 24 & 0x3, data & 0xFFFF
+
+    def hashfull(self):
+        """Returns the permille of slots in use, sampled from the first thousand"""
+        sample = self._data[:1000]
+        return sum(1 for data in sample if data) * 1000 // len(sample)
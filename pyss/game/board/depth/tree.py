@@ -1,75 +1,263 @@
-from copy import deepcopy
+import mmap
+import struct
+import sys
+from array import array
 from dataclasses import field
 from dataclasses import dataclass
-from typing import Literal
 
 from ..base import BaseBoard
+from ..fen import dump_fen, load_fen
+from ..moves import MOVES, move_code
+from .transposition import TranspositionTable
 
 Move = tuple[tuple[int, int], tuple[int, int]]
 
+# node index of the root, and of no node in the link columns
+ROOT = 0
+NONE = -1
 
-@dataclass
-class DepthNode:
+# magic, version, walk depth (-1 if unfinished), node count, FEN length, then the FEN
+# padded to 8 bytes and the columns: parents, first children, next siblings, moves
+MAGIC = b"PYSSTREE"
+VERSION = 1
+HEADER = struct.Struct("<8sHiQH")
 
-    """ A node in a Boardtree.
 
-        Each node represents a different board state, by storing the
-        last board node and the move that led to this board state.
-    """
-    parent: Literal['DepthNode'] | None = field(default=None)
-    children: list['DepthNode'] | None = field(default_factory=lambda: None)
-    move: Move | None = field(default=None)
+def transposition_mb(depth: int, cap: float = 16) -> float:
+    """Returns the size of a table with about a slot for each position a walk to depth expands, at most cap"""
+    # some 40 moves a position, and a bucket of two 16 byte slots for each
+    return min(cap, 40 ** min(max(depth, 0), 8) * 32 / (1024 * 1024))
+
+
+@dataclass
+class MoveCursor:
 
-    def add_child(self, child: 'DepthNode'):
-        if self.children is None:
-            self.children = []
+    """ Where a walk of the valid move tree stopped, so it can be resumed.
 
-        child.parent = self
-        self.children.append(child)
+        Holds the records still to be yielded, most recent on top, as
+        (depth, path, move) with moves in 16 bit codes (see `pyss.game.board.moves`).
+    """
+    key: int | None = field(default=None)
+    depth: int | None = field(default=None)
+    stack: list = field(default_factory=list)
+    # positions expanded so far and for how many more levels, None to expand every node
+    transpositions: TranspositionTable | None = field(default=None)
+    nodes: int = field(default=0)
 
-    def remove_child(self, child: 'DepthNode'):
-        child.parent = None
-        self.children.remove(child)
+    @property
+    def started(self) -> bool:
+        return self.key is not None
 
-    def __repr__(self):
-        return f"{self.parent}.{self.move}"
+    @property
+    def done(self) -> bool:
+        return self.started and not self.stack
 
 
 class MoveTree:
     """ A tree of moves rooted at a given board state. (usually initial)
+
+        Nodes are indices into parallel arrays: parent, first child, next sibling
+        and the 16 bit code of the move leading to the node, 14 bytes a node.
+        The root is node 0 and has no move. A node's board is found by replaying
+        the moves on its path, see `to_board`.
+
+        `save` writes the columns as they are to a file which `load` maps back
+        into memory, the columns of a loaded tree are views of the file.
     """
 
-    def __init__(self, board: BaseBoard):
-        self.starting_board = deepcopy(board)
+    def __init__(self, board: BaseBoard, hash_mb: float = 1):
+        self.starting_fen = dump_fen(board)
+        self._board_type = type(board)
+
+        # positions already expanded in this tree and to which depth
+        self.transpositions = TranspositionTable(hash_mb)
+        self._mmap = None
+
+        self._parents = array('i', [NONE])
+        self._first_children = array('i', [NONE])
+        self._next_siblings = array('i', [NONE])
+        self._moves = array('H', [0])
+
+        self._real_turns = [ROOT]
+        self._current_node = ROOT
+
+        # the walk the tree is built from and the nodes on its current path
+        self.cursor = MoveCursor(transpositions=self.transpositions)
+        self._spine = [self._current_node]
+
+    @property
+    def starting_board(self) -> BaseBoard:
+        """Returns a new board at the root position"""
+        return load_fen(self._board_type(), self.starting_fen)
+
+    def __len__(self):
+        """Returns the number of nodes, the root included"""
+        return len(self._moves)
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the memory taken by the node columns"""
+        return sum(column.itemsize * len(column)
+                   for column in (self._parents, self._first_children, self._next_siblings, self._moves))
+
+    def parent(self, node: int) -> int:
+        """Returns the parent of node, NONE for the root"""
+        return self._parents[node]
+
+    def move(self, node: int) -> Move | None:
+        """Returns the move leading to node as a `make_move` tuple, None for the root"""
+        return MOVES[self._moves[node]] if node != ROOT else None
+
+    def children(self, node: int = ROOT) -> list[int]:
+        """Returns the children of node in the order they were added"""
+        children = []
+        child = self._first_children[node]
+        while child != NONE:
+            children.append(child)
+            child = self._next_siblings[child]
+
+        # children are linked in front of their siblings
+        children.reverse()
+        return children
+
+    def path(self, node: int) -> list[Move]:
+        """Returns the moves from the root to node"""
+        moves = []
+        while node != ROOT:
+            moves.append(MOVES[self._moves[node]])
+            node = self._parents[node]
 
-        self._root = DepthNode()
-        self._real_turns = [self._root]
-        self._current_node = self._root
+        moves.reverse()
+        return moves
 
-    def to_board(self) -> BaseBoard:
-        """ Return the board state represented by the given node.
+    def depth(self, node: int) -> int:
+        """Returns the number of moves from the root to node"""
+        depth = 0
+        while node != ROOT:
+            node = self._parents[node]
+            depth += 1
+        return depth
 
+    def make_path(self, board: BaseBoard, node: int) -> list:
+        """ Makes the moves from the root to node on board, which must be at the root position.
+
+            Returns the undo records, to be unmade in reverse.
         """
-        board = deepcopy(self.starting_board)
+        return [board.make_move(*move) for move in self.path(node)]
 
-        # Build board by breadth-first traversal executing parent moves then child moves
-        queue = [self._root]
-        while queue:
-            node = queue.pop(0)
-            if node.move is not None:
-                board.move(*node.move)
+    def to_board(self, node: int | None = None) -> BaseBoard:
+        """ Return the board state represented by the given node, the current one by default.
 
-            if node.children is not None:
-                queue.extend(node.children)
+        """
+        if node is None:
+            node = self._current_node
 
+        board = self.starting_board
+        self.make_path(board, node)
         return board
 
-    def add_move(self, move: Move, node: DepthNode, real_turn: bool = False):
+    def add_move(self, move: Move | int, node: int = ROOT, real_turn: bool = False) -> int:
         """ Add a move to the tree, rooted at the given node.
+
+            move is a `make_move` tuple or a 16 bit move code. Returns the new node.
         """
-        child = DepthNode(move=move)
-        node.add_child(child)
+        if self._mmap is not None:
+            self._detach()
+
+        child = len(self._moves)
+        self._parents.append(node)
+        self._first_children.append(NONE)
+        self._next_siblings.append(self._first_children[node])
+        self._moves.append(move if isinstance(move, int) else move_code(move))
+        self._first_children[node] = child
 
         if real_turn:
             self._real_turns.append(child)
             self._current_node = child
+
+        return child
+
+    def _columns(self):
+        return self._parents, self._first_children, self._next_siblings, self._moves
+
+    def save(self, path):
+        """Writes the tree and its starting position to a file, see `load`"""
+        fen = self.starting_fen.encode()
+        depth = self.cursor.depth if self.cursor.done else -1
+
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, depth, len(self), len(fen)))
+            f.write(fen)
+            f.write(bytes(-(HEADER.size + len(fen)) % 8))
+            for column in self._columns():
+                if sys.byteorder != "little":
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                f.write(column)
+
+    @classmethod
+    def load(cls, path, board_type=None, hash_mb: float = 1) -> 'MoveTree':
+        """ Opens a tree written by `save` without reading it into memory.
+
+            The columns are views of the mapped file, the operating system pages them in
+            as the tree is walked. Adding a move copies them into memory first.
+            Boards are made as board_type, a Chessboard by default.
+        """
+        if board_type is None:
+            from .depth import Chessboard
+            board_type = Chessboard
+
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, depth, nodes, fen_length = HEADER.unpack_from(mapped)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"Not a move tree file: {path}")
+
+            offset = HEADER.size + fen_length
+            fen = mapped[HEADER.size:offset].decode()
+            offset += -offset % 8
+            if len(mapped) != offset + nodes * 14:
+                raise ValueError(f"Truncated move tree file: {path}")
+        except (ValueError, struct.error):
+            mapped.close()
+            raise
+
+        tree = cls(load_fen(board_type(), fen), hash_mb=hash_mb)
+        tree._mmap = mapped
+
+        view = memoryview(mapped)
+        columns = []
+        for typecode in "iiiH":
+            size = nodes * struct.calcsize(typecode)
+            column = view[offset:offset + size].cast(typecode)
+            if sys.byteorder != "little":
+                column = array(typecode, column)
+                column.byteswap()
+            columns.append(column)
+            offset += size
+        view.release()
+        tree._parents, tree._first_children, tree._next_siblings, tree._moves = columns
+
+        # a finished walk is not walked again, an unfinished one is started over by `valid_move_tree`
+        tree.cursor.key = tree.starting_board.zobrist_key
+        tree.cursor.depth = depth
+        return tree
+
+    def _detach(self):
+        """Copies the columns out of the mapped file, so they can grow"""
+        columns = [array(column.typecode if isinstance(column, array) else column.format, column)
+                   for column in self._columns()]
+        self.close()
+        self._parents, self._first_children, self._next_siblings, self._moves = columns
+
+    def close(self):
+        """Unmaps the file of a loaded tree, its columns can't be used afterwards"""
+        if self._mmap is None:
+            return
+        for column in self._columns():
+            if isinstance(column, memoryview):
+                column.release()
+        self._mmap.close()
+        self._mmap = None
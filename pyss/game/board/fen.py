@@ -0,0 +1,182 @@
+""" Forsyth-Edwards Notation for setting up arbitrary positions, and EPD files of them.
+
+    Castling rights are not stored on the board, they follow from which kings and
+    rooks have moved, so loading a FEN marks every piece that lost its right as moved.
+
+    An EPD record is the first four FEN fields followed by operations, such as
+    `bm Nf3; id "WAC.001";` or the `D1 20 ;D2 400` of perft suites. `read_epd`
+    streams them from a file a line at a time.
+"""
+import re
+from pyss.game.board.bitboard import POSITIONS, lsb
+from pyss.game.board.tables import CASTLING
+from pyss.game.notation import notation_to_position, position_to_notation
+from pyss.game.piece import Piece, piece_dict
+
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# FEN letter per piece type, e.g. "n" for knight
+LETTERS = {ty: piece_dict[ty]["notation"].lower() for ty in piece_dict}
+TYPES = {letter: ty for ty, letter in LETTERS.items()}
+
+CASTLING_LETTERS = "KQkq"
+
+
+def load_fen(board, fen):
+    """ Sets up a PlayableBoard from a FEN string and returns it.
+
+        The move counters are optional, they default to "0 1".
+    """
+    fields = fen.split()
+    if not 4 <= len(fields) <= 6:
+        raise ValueError(f"Invalid FEN, expected 4 to 6 fields: {fen!r}")
+    placement, active, rights, en_passant = fields[:4]
+    counters = fields[4:] + ["0", "1"][len(fields) - 4:]
+    if not all(counter.isdigit() for counter in counters):
+        raise ValueError(f"Invalid FEN move counters: {fen!r}")
+    halfmove_clock, fullmove_number = map(int, counters)
+
+    ranks = placement.split("/")
+    if len(ranks) != 8:
+        raise ValueError(f"Invalid FEN, expected 8 ranks: {fen!r}")
+
+    board.reset(no_initial_pieces=True)
+    placements = []
+    for i, rank in enumerate(ranks):
+        y = 7 - i
+        x = 0
+        for char in rank:
+            if char.isdigit():
+                x += int(char)
+                continue
+            if char.lower() not in TYPES or x > 7:
+                raise ValueError(f"Invalid FEN rank {rank!r}")
+
+            piece = Piece("white" if char.isupper() else "black", TYPES[char.lower()])
+            piece.has_moved = True
+            placements.append(((x, y), piece))
+            x += 1
+        if x != 8:
+            raise ValueError(f"Invalid FEN rank {rank!r}")
+    board.set_pieces(placements)
+
+    # pawns can still jump from where they started, kings and rooks only keep the rights listed
+    for piece, position in board.active_pieces.items():
+        if piece.type == "pawn":
+            piece.has_moved = position not in piece.initial_positions
+
+    for letter, (color, king_position, rook_position) in zip(CASTLING_LETTERS, CASTLING):
+        if letter in rights:
+            king, rook = board[king_position], board[rook_position]
+            if not king or not rook or king.type != "king" or rook.type != "rook":
+                raise ValueError(f"Invalid FEN castling rights {rights!r}")
+            king.has_moved = False
+            rook.has_moved = False
+
+    if active not in ("w", "b"):
+        raise ValueError(f"Invalid FEN side to move {active!r}")
+    board.active_color = "white" if active == "w" else "black"
+
+    # the board keeps the pawn that can be taken alongside the square behind it
+    if en_passant != "-":
+        behind = notation_to_position(en_passant)
+        jumped = (behind[0], behind[1] + 1 if board.active_color == "black" else behind[1] - 1)
+        board.en_passant_available = (jumped, behind)
+
+    board.halfmove_clock = halfmove_clock
+    board.fullmove_number = fullmove_number
+
+    king = board.bitboards[board.active_color]["king"]
+    if king and board.in_check(board.active_color):
+        board._check = POSITIONS[lsb(king)]
+        board._checkmate = board._check if not board.generate_legal_moves() else None
+
+    board._zobrist = board.compute_zobrist_key()
+    return board
+
+
+def dump_fen(board):
+    """Returns the FEN string of a PlayableBoard's position."""
+    ranks = []
+    for y in range(7, -1, -1):
+        rank, empty = "", 0
+        for x in range(8):
+            piece = board.board[x][y]
+            if not piece:
+                empty += 1
+                continue
+            if empty:
+                rank += str(empty)
+                empty = 0
+            letter = LETTERS[piece.type]
+            rank += letter.upper() if piece.color == "white" else letter
+        ranks.append(rank + (str(empty) if empty else ""))
+
+    rights = board.castling_rights
+    castling = "".join(letter for i, letter in enumerate(CASTLING_LETTERS) if rights & 1 << i) or "-"
+    en_passant = position_to_notation(board.en_passant_available[1]) if board.en_passant_available else "-"
+
+    return f"{'/'.join(ranks)} {board.active_color[0]} {castling} {en_passant} " \
+           f"{board.halfmove_clock} {board.fullmove_number}"
+
+
+# an operation is everything up to the next semicolon outside of a quoted string
+_OPERATION = re.compile(r'(?:[^;"]|"[^"]*")+')
+_OPERAND = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def parse_epd(line):
+    """ Returns (fen, operations) of an EPD record.
+
+        operations maps each opcode to its operands, with quotes taken off. The move counters
+        come from the "hmvc" and "fmvn" operations, or from two numbers after the position
+        as some files write them, else they are "0 1".
+    """
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"Invalid EPD, expected at least 4 fields: {line!r}")
+    rest = fields[4] if len(fields) > 4 else ""
+
+    halfmove_clock, fullmove_number = "0", "1"
+    words = rest.split(None, 2)
+    if len(words) >= 2 and words[0].isdigit() and words[1].isdigit():
+        halfmove_clock, fullmove_number = words[:2]
+        rest = words[2] if len(words) > 2 else ""
+
+    operations = {}
+    for operation in _OPERATION.findall(rest):
+        operands = [quoted or word for quoted, word in _OPERAND.findall(operation)]
+        if operands:
+            operations[operands[0]] = operands[1:]
+
+    halfmove_clock = (operations.get("hmvc") or [halfmove_clock])[0]
+    fullmove_number = (operations.get("fmvn") or [fullmove_number])[0]
+    return " ".join(fields[:4] + [halfmove_clock, fullmove_number]), operations
+
+
+def read_epd(source, board=None):
+    """ Yields (board, operations) for each record of an EPD file, given as a path or the open file.
+
+        Every record is set up on a new PlayableBoard, or on board again and again when
+        given, which is quicker but leaves only the last position once the loop moves on.
+    """
+    if isinstance(source, str) or hasattr(source, "__fspath__"):
+        with open(source) as f:
+            yield from read_epd(f, board)
+        return
+
+    # imported here, the board imports this module
+    from pyss.game.board.playable import PlayableBoard
+
+    for number, line in enumerate(source, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            fen, operations = parse_epd(line)
+            record = load_fen(board if board is not None else PlayableBoard(initialize=False), fen)
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}") from None
+        yield record, operations
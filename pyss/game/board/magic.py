@@ -0,0 +1,242 @@
+""" Magic bitboard attack lookup for the sliding pieces.
+
+    For each square the relevant blockers `occupied & mask` are hashed with a
+    magic multiplier into a dense per-square slice of one flat attack table:
+
+        TABLE[offset + (((occupied & mask) * magic) & FULL) >> shift]
+
+    Finding the magics and filling the tables is slow in Python, so the result
+    is cached to `data/magics.bin` and only regenerated when that file is
+    missing or does not match the current piece_dict.
+"""
+import logging
+import os
+import random
+import sys
+import zlib
+from array import array
+
+from pyss.game.board.bitboard import BITS, FULL, POSITIONS, popcount
+from pyss.game.piece import piece_dict
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "data/magics.bin")
+CACHE_HEADER = b"PYSSMAG1"
+
+# kinds of sliding lines with a magic table, named after the piece that moves along them
+KINDS = ("rook", "bishop")
+
+
+def _directions(kind):
+    return tuple(tuple(d) for d in piece_dict[kind]["valid_relative_moves"])
+
+
+def slow_attacks(square, occupied, directions):
+    """Returns the attacked squares by walking each ray until the first blocker."""
+    x, y = POSITIONS[square]
+    attacks = 0
+    for dx, dy in directions:
+        nx, ny = x + dx, y + dy
+        while 0 <= nx <= 7 and 0 <= ny <= 7:
+            bit = BITS[ny * 8 + nx]
+            attacks |= bit
+            if occupied & bit:
+                break
+            nx, ny = nx + dx, ny + dy
+    return attacks
+
+
+def relevant_mask(square, directions):
+    """Returns the squares whose occupancy can change the attacks, i.e. the rays minus their last square."""
+    x, y = POSITIONS[square]
+    mask = 0
+    for dx, dy in directions:
+        nx, ny = x + dx, y + dy
+        while 0 <= nx + dx <= 7 and 0 <= ny + dy <= 7:
+            mask |= BITS[ny * 8 + nx]
+            nx, ny = nx + dx, ny + dy
+    return mask
+
+
+def subsets(mask):
+    """Yields every subset of a mask (Carry-Rippler)."""
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if not subset:
+            break
+
+
+def find_magic(square, directions, rng, max_tries=100_000_000):
+    """Returns (magic, mask, shift, attack_table) for one square."""
+    mask = relevant_mask(square, directions)
+    bits = popcount(mask)
+    shift = 64 - bits
+
+    occupancies = list(subsets(mask))
+    attacks = [slow_attacks(square, occupancy, directions) for occupancy in occupancies]
+
+    for _ in range(max_tries):
+        magic = rng.getrandbits(64) & rng.getrandbits(64) & rng.getrandbits(64)
+        if popcount(((mask * magic) & FULL) >> 56) < 6:
+            continue
+
+        table = [None] * (1 << bits)
+        for occupancy, attack in zip(occupancies, attacks):
+            index = ((occupancy * magic) & FULL) >> shift
+            if table[index] is None:
+                table[index] = attack
+            elif table[index] != attack:
+                break
+        else:
+            return magic, mask, shift, [attack or 0 for attack in table]
+
+    raise RuntimeError(f"No magic found for square {square}")
+
+
+class MagicTable:
+    """ Per-square magics, masks, shifts and offsets into one flat attack table. """
+
+    def __init__(self, magics, masks, shifts, offsets, table):
+        self.magics = magics
+        self.masks = masks
+        self.shifts = shifts
+        self.offsets = offsets
+        self.table = table
+
+    @staticmethod
+    def generate(directions, seed=0):
+        """Searches a magic for every square and fills the attack table."""
+        rng = random.Random(seed)
+        magics, masks, shifts, offsets = array('Q'), array('Q'), array('B'), array('I')
+        table = array('Q')
+        for square in range(64):
+            magic, mask, shift, attacks = find_magic(square, directions, rng)
+            magics.append(magic)
+            masks.append(mask)
+            shifts.append(shift)
+            offsets.append(len(table))
+            table.extend(attacks)
+
+        return MagicTable(magics, masks, shifts, offsets, table)
+
+    def attacks(self, square, occupied):
+        """Returns the attacked squares from square for the given occupancy."""
+        return self.table[self.offsets[square] +
+                          ((((occupied & self.masks[square]) * self.magics[square]) & FULL) >> self.shifts[square])]
+
+    def arrays(self):
+        return self.magics, self.masks, self.shifts, self.offsets, self.table
+
+
+def _fingerprint():
+    return repr([_directions(kind) for kind in KINDS]).encode()
+
+
+def dump_tables(tables, path=CACHE_PATH):
+    """Serializes the magic tables as zlib compressed little-endian arrays."""
+    chunks = [_fingerprint()]
+    for kind in KINDS:
+        for arr in tables[kind].arrays():
+            if sys.byteorder == "big":
+                arr = array(arr.typecode, arr)
+                arr.byteswap()
+            chunks.append(arr.typecode.encode() + arr.tobytes())
+
+    payload = b"".join(len(chunk).to_bytes(4, "little") + chunk for chunk in chunks)
+    with open(path, "wb") as f:
+        f.write(CACHE_HEADER + zlib.compress(payload, 9))
+
+
+def load_tables(path=CACHE_PATH):
+    """Loads tables written by `dump_tables`, or returns None if missing or stale."""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+
+    if not data.startswith(CACHE_HEADER):
+        return None
+
+    try:
+        payload = memoryview(zlib.decompress(data[len(CACHE_HEADER):]))
+    except zlib.error:
+        return None
+
+    chunks = []
+    while payload:
+        size = int.from_bytes(payload[:4], "little")
+        chunks.append(payload[4:4 + size])
+        payload = payload[4 + size:]
+
+    if not chunks or bytes(chunks[0]) != _fingerprint() or len(chunks) != 1 + 5 * len(KINDS):
+        return None
+
+    tables = {}
+    for i, kind in enumerate(KINDS):
+        arrays = []
+        for chunk in chunks[1 + i * 5:6 + i * 5]:
+            arr = array(chr(chunk[0]))
+            arr.frombytes(chunk[1:])
+            if sys.byteorder == "big":
+                arr.byteswap()
+            arrays.append(arr)
+        tables[kind] = MagicTable(*arrays)
+
+    return tables
+
+
+def build_tables(path=CACHE_PATH):
+    """Loads the cached magic tables, generating and caching them if needed."""
+    tables = load_tables(path)
+    if tables is not None:
+        return tables
+
+    logger.info("Generating magic bitboard tables...")
+    tables = {kind: MagicTable.generate(_directions(kind)) for kind in KINDS}
+    try:
+        dump_tables(tables, path)
+    except OSError as e:
+        logger.warning(f"Could not cache magic tables to {path}: {e}")
+
+    return tables
+
+
+TABLES = build_tables()
+ROOK = TABLES["rook"]
+BISHOP = TABLES["bishop"]
+
+
+def _line_kinds(ty):
+    """Which magic tables a sliding piece from piece_dict moves along."""
+    moves = set(tuple(d) for d in piece_dict[ty]["valid_relative_moves"])
+    return tuple(kind for kind in KINDS if set(_directions(kind)) <= moves)
+
+
+# e.g. LINE_KINDS["queen"] == ("rook", "bishop")
+LINE_KINDS = {ty: _line_kinds(ty) for ty in piece_dict if piece_dict[ty]["displacement"] > 1}
+
+
+def rook_attacks(square, occupied):
+    """Returns the squares a rook on square attacks."""
+    return ROOK.table[ROOK.offsets[square] +
+                      ((((occupied & ROOK.masks[square]) * ROOK.magics[square]) & FULL) >> ROOK.shifts[square])]
+
+
+def bishop_attacks(square, occupied):
+    """Returns the squares a bishop on square attacks."""
+    return BISHOP.table[BISHOP.offsets[square] +
+                        ((((occupied & BISHOP.masks[square]) * BISHOP.magics[square]) & FULL) >> BISHOP.shifts[square])]
+
+
+def slider_attacks(ty, square, occupied):
+    """Returns the squares a sliding piece of type ty on square attacks."""
+    attacks = 0
+    for kind in LINE_KINDS[ty]:
+        attacks |= TABLES[kind].attacks(square, occupied)
+    return attacks
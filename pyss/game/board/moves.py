@@ -0,0 +1,63 @@
+""" Compact 16 bit move encoding for whole-side move generation.
+
+    A move is `from | to << 6 | flags << 12` with square indices (see
+    `pyss.game.board.bitboard`), so a side's moves fit in one `array('H')`.
+    Castling is encoded as the king moving onto its rook, the way `make_move` takes it.
+"""
+from pyss.game.board.bitboard import POSITIONS, to_square
+from pyss.game.board.tables import PROMOTIONS
+
+
+QUIET = 0
+CASTLE = 1
+EN_PASSANT = 2
+# PROMOTION + PROMOTIONS.index(type)
+PROMOTION = 4
+
+PROMOTION_FLAGS = {piece_type: PROMOTION + i for i, piece_type in enumerate(PROMOTIONS)}
+
+
+def encode_move(square, target, flags=QUIET):
+    """Returns the 16 bit code of a move between two square indices."""
+    return square | target << 6 | flags << 12
+
+
+def move_code(move):
+    """ Returns the 16 bit code of a `make_move` tuple.
+
+        Castles and en passant captures come back as quiet moves, `MOVES` decodes them the same.
+    """
+    flags = PROMOTION_FLAGS[move[2]] if len(move) > 2 and move[2] is not None else QUIET
+    return encode_move(to_square(move[0]), to_square(move[1]), flags)
+
+
+def move_from(move):
+    """Returns the square index a move starts on."""
+    return move & 0x3F
+
+
+def move_to(move):
+    """Returns the square index a move ends on."""
+    return move >> 6 & 0x3F
+
+
+def move_flags(move):
+    """Returns the flags of a move."""
+    return move >> 12
+
+
+def _decode(move):
+    position, new_position = POSITIONS[move & 0x3F], POSITIONS[move >> 6 & 0x3F]
+    flags = move >> 12
+    if flags >= PROMOTION:
+        return position, new_position, PROMOTIONS[flags - PROMOTION]
+    return position, new_position
+
+
+# MOVES[move] is the move as a `make_move(*move)` tuple, decoding is a lookup
+MOVES = tuple(_decode(move) for move in range((PROMOTION + len(PROMOTIONS)) << 12))
+
+
+def decode_move(move):
+    """Returns a move code as (position, new_position[, promotion])."""
+    return MOVES[move]
@@ -1,15 +1,55 @@
 import logging
 
+from array import array
+from dataclasses import dataclass, field
+
 from pyss.game.board.base import BaseBoard
+from pyss.game.board.bitboard import BETWEEN, BITS, FULL, POSITIONS, between, iter_bits, lsb, to_square
+from pyss.game.board.fen import dump_fen, load_fen
+from pyss.game.board.magic import LINE_KINDS, TABLES, slider_attacks
+from pyss.game.board.moves import CASTLE, EN_PASSANT, MOVES, PROMOTION_FLAGS
+from pyss.game.board.polyglot import polyglot_key
+from pyss.game.board.tables import ATTACKS, CASTLING, LEAPERS, PAWN_CAPTURES, PAWN_DOUBLE_STEPS, PROMOTION_RANKS, \
+    PROMOTIONS, STEPS
+from pyss.game.board.zobrist import SIDE_KEY, castling_key, en_passant_key
 from pyss.game.notation import generate_notation
-from ..piece import piece_dict
+from ..piece import piece_dict, Piece
 
 
 logger = logging.getLogger(__name__)
 
 
+# the sliding piece types moving along each kind of line, e.g. _LINE_TYPES["rook"] == ("rook", "queen")
+_LINE_TYPES = {kind: tuple(ty for ty, kinds in LINE_KINDS.items() if kind in kinds) for kind in TABLES}
+
+
+@dataclass
+class Undo:
+    """ Everything a move changed, so that `PlayableBoard.unmake_move` can restore it. """
+    move: tuple
+    piece: Piece
+    active_color: str
+    en_passant_available: tuple | bool
+    check: tuple | None
+    checkmate: tuple | None
+    zobrist_key: int
+    halfmove_clock: int = 0
+    fullmove_number: int = 1
+
+    # (position, piece previously there) in the order the squares were changed
+    squares: list = field(default_factory=list)
+    # (piece, previous has_moved)
+    has_moved: list = field(default_factory=list)
+
+    capture: bool = False
+    en_passant: bool = False
+    castle: str | bool = False
+
+
 class PlayableBoard(BaseBoard):
     def __init__(self, initialize=True):
+        self._active_color = "white"
+
         super().__init__(initialize=initialize)
 
         self.active_color = "white"
@@ -20,15 +60,72 @@ class PlayableBoard(BaseBoard):
         self._check = None
         self._checkmate = None
 
+        # plies since the last capture or pawn move, and the number of the move being played
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        self._undo_stack = []
+
+    @classmethod
+    def from_fen(cls, fen, **kwargs):
+        """Returns a new board set up from a FEN string, see `pyss.game.board.fen`"""
+        return load_fen(cls(initialize=False, **kwargs), fen)
+
+    def to_fen(self):
+        """Returns the FEN string of the position"""
+        return dump_fen(self)
+
     def reset(self, **kwargs):
         super().reset(**kwargs)
 
         self.move_history = []
+        self._undo_stack = []
 
         self.en_passant_available = False
         self._check = None
         self._checkmate = None
 
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        self._zobrist = self.compute_zobrist_key()
+        self._init_attack_maps()
+
+    @property
+    def active_color(self):
+        """Returns the color to move"""
+        return self._active_color
+
+    @active_color.setter
+    def active_color(self, color):
+        if color != self._active_color:
+            self._zobrist ^= SIDE_KEY
+        self._active_color = color
+
+    @property
+    def castling_rights(self):
+        """Returns a bitmask of the castling rights left, one bit per entry of tables.CASTLING"""
+        rights = 0
+        for i, (color, king_position, rook_position) in enumerate(CASTLING):
+            king = self.board[king_position[0]][king_position[1]]
+            rook = self.board[rook_position[0]][rook_position[1]]
+            if king and rook and king.type == "king" and rook.type == "rook" and\
+                    king.color == color and rook.color == color and not king.has_moved and not rook.has_moved:
+                rights |= 1 << i
+        return rights
+
+    @property
+    def polyglot_key(self):
+        """Returns the key of the position in Polyglot opening books, computed from scratch"""
+        return polyglot_key(self)
+
+    def compute_zobrist_key(self):
+        """Computes the Zobrist key of the position, side to move, castling rights and en passant from scratch."""
+        key = super().compute_zobrist_key()
+        if self._active_color == "black":
+            key ^= SIDE_KEY
+        return key ^ castling_key(self.castling_rights) ^ en_passant_key(self.en_passant_available)
+
     def get_valid_moves(self, position=None):
         """Returns a list of valid moves for a piece. """
         valid_moves = []
@@ -37,11 +134,14 @@ class PlayableBoard(BaseBoard):
             return []
 
         if piece.type == "pawn":
-            # TODO: check for promotion
             # check for en passant, self.en_passant_available is the position of the pawn that can be captured
+            # and the square behind it the capturing pawn lands on
             if self.en_passant_available:
-                if abs(self.en_passant_available[0][0] - position[0]) == 1:
-                    valid_moves.append(self.en_passant_available[1])
+                captured_position, behind = self.en_passant_available
+                captured = self[captured_position]
+                if captured and not piece.compare_color(captured) and captured_position[1] == position[1] and\
+                        abs(captured_position[0] - position[0]) == 1:
+                    valid_moves.append(behind)
         elif piece.type in ["king", "rook"]:
             # check for castling by checking if king and rook have moved
             if not piece.has_moved:
@@ -55,154 +155,527 @@ class PlayableBoard(BaseBoard):
                         if self.check_path(position, other_pos, castling=True):
                             valid_moves.append(other_pos)
 
-        for move in piece.valid_relative_moves:
-            for displacement in range(1, piece.displacement + 1):
-                new_position = (
-                    position[0] + move[0] * displacement,
-                    position[1] + move[1] * displacement)
-                if self.board_safe(position, new_position):
-                    if piece.type in ["bishop", "rook", "queen"]:
-                        if self.check_path(position, new_position):
-                            valid_moves.append(new_position)
-                    elif piece.type == "pawn":
-                        if not self[new_position]:
-                            valid_moves.append(new_position)
-                        for capture in piece.valid_captures:
-                            capture_position = (
-                                position[0] + capture[0], position[1] + capture[1])
-                            if self.board_safe(position, capture_position):
-                                p = self[capture_position]
-                                if p and not piece.compare_color(p):
-                                    valid_moves.append(capture_position)
-
-                        # if initial position, check two squares
-                        if position in piece.initial_positions:
-                            new_position = (
-                                position[0] + move[0] * 2,
-                                position[1] + move[1] * 2)
-                            if self.check_path(position, new_position):
-                                if not self[new_position]:
-                                    valid_moves.append(new_position)
-                    else:
-                        valid_moves.append(new_position)
+        square = to_square(position)
+        own = self._occupancy[piece.color]
+        if piece.type in LINE_KINDS:
+            for target in iter_bits(slider_attacks(piece.type, square, self.occupied) & ~own):
+                valid_moves.append(POSITIONS[target])
+        elif piece.type == "pawn":
+            occupied = self.occupied
+            for target in STEPS["pawn"][piece.color][square]:
+                if not occupied & BITS[target]:
+                    valid_moves.append(POSITIONS[target])
+
+            enemy = occupied & ~own
+            for target in PAWN_CAPTURES[piece.color][square]:
+                if enemy & BITS[target]:
+                    valid_moves.append(POSITIONS[target])
+
+            # if initial position and the square in front is free, check two squares
+            for target in PAWN_DOUBLE_STEPS[piece.color][square]:
+                if not occupied & (BITS[target] | between(position, POSITIONS[target])):
+                    valid_moves.append(POSITIONS[target])
+        else:
+            for target in STEPS[piece.type][piece.color][square]:
+                if not own & BITS[target]:
+                    valid_moves.append(POSITIONS[target])
 
         # logger.debug(f"Valid moves for {piece} at {position}: {valid_moves}")
         return valid_moves
 
-    def __find_check(self, position):
-        """Returns true if the king is threatened by position."""
-        # get the piece at the position
+    def get_legal_moves(self, position):
+        """Returns the legal destinations of the piece at position, see generate_legal_moves."""
         piece = self[position]
-        # see if the piece can see a king
+        if not piece:
+            return []
+
+        return self.get_legal_moves_by_position(piece.color).get(position, [])
+
+    def get_legal_moves_by_position(self, color=None):
+        """Returns the legal destinations of every piece of color, keyed by position, from one generation."""
+        moves = {}
+        for move in self.generate_move_array(color):
+            position, new_position = POSITIONS[move & 0x3F], POSITIONS[move >> 6 & 0x3F]
+            destinations = moves.setdefault(position, [])
+            if new_position not in destinations:
+                destinations.append(new_position)
+            # a rook may be picked up to castle too
+            if move >> 12 == CASTLE:
+                moves.setdefault(new_position, []).append(position)
+        return moves
+
+    # attack maps
+    @property
+    def attack_counts(self):
+        """Returns, per color, how many of its pieces attack each square"""
+        return self._attack_counts
+
+    def attacked_squares(self, color):
+        """Returns a bitboard of the squares color attacks."""
+        return self._attacked[color]
+
+    def is_attacked(self, position, color):
+        """Returns True if color attacks position."""
+        return bool(self._attacked[color] & BITS[to_square(position)])
+
+    def _piece_attacks(self, piece, square, occupied):
+        if piece.type in LINE_KINDS:
+            return slider_attacks(piece.type, square, occupied)
+        return ATTACKS[piece.type][piece.color][square]
+
+    def _init_attack_maps(self):
+        """Builds the attack maps from scratch."""
+        self._attacks_from = [0] * 64
+        self._attack_colors = [None] * 64
+        self._attack_counts = {"white": [0] * 64, "black": [0] * 64}
+        self._attacked = {"white": 0, "black": 0}
+
+        occupied = self.occupied
+        for piece, position in self._active_pieces.items():
+            square = to_square(position)
+            self._attacks_from[square] = self._piece_attacks(piece, square, occupied)
+            self._attack_colors[square] = piece.color
+            self._count_attacks(piece.color, self._attacks_from[square], 1)
+
+    def _count_attacks(self, color, attacks, delta):
+        counts = self._attack_counts[color]
+        attacked = self._attacked[color]
+        while attacks:
+            low = attacks & -attacks
+            attacks ^= low
+            target = low.bit_length() - 1
+
+            count = counts[target] + delta
+            counts[target] = count
+            if count == 0:
+                attacked &= ~low
+            elif count == delta:
+                attacked |= low
+        self._attacked[color] = attacked
+
+    def _refresh_attacks(self, square, occupied):
+        """Recounts the attacks of whatever is on square now."""
+        old, old_color = self._attacks_from[square], self._attack_colors[square]
+
+        x, y = POSITIONS[square]
+        piece = self.board[x][y]
         if piece:
-            # TODO: use _selected_valid_moves instead of valid_moves
-            for move in self.get_valid_moves(position):
-                next_piece = self[move]
-                if next_piece and next_piece.type == "king" and not next_piece.compare_color(piece):
-                    return move
+            new, new_color = self._piece_attacks(piece, square, occupied), piece.color
+        else:
+            new, new_color = 0, None
 
-        return False
+        self._attacks_from[square] = new
+        self._attack_colors[square] = new_color
+        if old_color == new_color:
+            # only count the squares that changed
+            old, new = old & ~new, new & ~old
+        if old:
+            self._count_attacks(old_color, old, -1)
+        if new:
+            self._count_attacks(new_color, new, 1)
 
-    def __find_checkmate(self, position):
-        # if king has no valid moves, it's checkmate
-        return False
+    def _update_attacks(self, square):
+        """ Updates the attack maps after square changed.
 
-    def move(self, position, new_position, update=False):
-        """ Semi-unsafely moves a piece destroying any piece that is in the destination.
-            This expects that the move is valid under chess rules. 
+            Besides the piece on the square, only the sliders with a line to it attack differently,
+            and those are found by looking back along the lines from the square itself.
         """
-        en_passanted = False
-        capture = False
-        castled = False
+        occupied = self.occupied
+
+        sliders = 0
+        for kind, types in _LINE_TYPES.items():
+            pieces = 0
+            for color_bitboards in self._bitboards.values():
+                for ty in types:
+                    pieces |= color_bitboards[ty]
+            if pieces:
+                sliders |= TABLES[kind].attacks(square, occupied) & pieces
+
+        for slider in iter_bits(sliders):
+            self._refresh_attacks(slider, occupied)
+        self._refresh_attacks(square, occupied)
+
+    def set_pieces(self, placements):
+        """Adds (position, piece) pairs to the board, rebuilding the attack maps once for all of them"""
+        for key, value in placements:
+            BaseBoard.__setitem__(self, key, value)
+        self._init_attack_maps()
+
+    def __setitem__(self, key, value):
+        """Adds a piece to the board and updates the attack maps"""
+        # remove a captured piece without counting the emptied square separately
+        if self[key]:
+            super().__delitem__(key)
+        super().__setitem__(key, value)
+        self._update_attacks(to_square(key))
+
+    def __delitem__(self, key):
+        """Removes a piece from the board and updates the attack maps"""
+        super().__delitem__(key)
+        self._update_attacks(to_square(key))
+
+    def attackers_to(self, square, color, occupied=None):
+        """Returns a bitboard of the pieces of color attacking square."""
+        if occupied is None:
+            occupied = self.occupied
+
+        bitboards = self._bitboards[color]
+        attackers = ATTACKS["pawn"]["black" if color == "white" else "white"][square] & bitboards["pawn"]
+        for ty in LEAPERS:
+            attackers |= ATTACKS[ty][color][square] & bitboards[ty]
+        for ty, kinds in LINE_KINDS.items():
+            if bitboards[ty]:
+                for kind in kinds:
+                    attackers |= TABLES[kind].attacks(square, occupied) & bitboards[ty]
+        return attackers
+
+    def in_check(self, color=None):
+        """Returns True if the king of color (default: the side to move) is attacked."""
+        if color is None:
+            color = self.active_color
+        king = self._bitboards[color]["king"]
+        return bool(self._attacked["black" if color == "white" else "white"] & king)
+
+    def _pins(self, king_square, own, enemy_bitboards, occupied):
+        """Returns {pinned square: mask of squares it may still move to} for the side owning own."""
+        pins = {}
+        for kind, table in TABLES.items():
+            snipers = 0
+            for ty, kinds in LINE_KINDS.items():
+                if kind in kinds:
+                    snipers |= enemy_bitboards[ty]
+
+            # look through our own pieces for enemy sliders on the king's lines
+            for sniper in iter_bits(table.attacks(king_square, occupied & ~own) & snipers):
+                blockers = BETWEEN[king_square * 64 + sniper] & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & own:
+                    pins[lsb(blockers)] = BETWEEN[king_square * 64 + sniper] | BITS[sniper]
+        return pins
+
+    def generate_legal_moves(self, color=None):
+        """ Returns every legal move of color (default: the side to move).
+
+            Moves are (position, new_position) tuples, or (position, new_position, promotion)
+            for promotions, so each can be passed on as `make_move(*move)`. Castling is
+            the king moving onto its rook and en passant the pawn moving behind its victim.
+        """
+        return [MOVES[move] for move in self.generate_move_array(color)]
+
+    def generate_move_array(self, color=None, captures_only=False):
+        """ Returns every legal move of color (default: the side to move) as an `array('H')`.
+
+            See `pyss.game.board.moves` for the encoding, `MOVES[move]` turns a code into
+            the tuple `generate_legal_moves` returns. Checkers and pins are found once
+            from the king square, so no move is tried out. With captures_only only captures
+            and promotions are generated, as a quiescence search wants them.
+        """
+        if color is None:
+            color = self.active_color
+        them = "black" if color == "white" else "white"
+
+        bitboards = self._bitboards[color]
+        enemy_bitboards = self._bitboards[them]
+        own = self._occupancy[color]
+        enemy = self._occupancy[them]
+        occupied = own | enemy
+
+        # kings are never captured
+        targets = ~own & ~enemy_bitboards["king"] & FULL
+        # pawns are masked in `_pawn_moves`, their promotions count as captures
+        captures = enemy if captures_only else FULL
+        moves = array('H')
+        append = moves.append
+
+        checkers = 0
+        pins = {}
+        king = bitboards["king"]
+        if king:
+            king_square = lsb(king)
+            checkers = self.attackers_to(king_square, them, occupied)
+            pins = self._pins(king_square, own, enemy_bitboards, occupied)
+
+            # the king may not step onto an attacked square, including further along the line
+            # a slider checks it on, which the attack map sees as blocked by the king itself
+            attacked = self._attacked[them]
+            for checker in iter_bits(checkers & ~enemy_bitboards["pawn"]):
+                for target in iter_bits(ATTACKS["king"][color][king_square]):
+                    if BETWEEN[checker * 64 + target] & king:
+                        attacked |= BITS[target]
 
+            for target in iter_bits(ATTACKS["king"][color][king_square] & targets & captures & ~attacked):
+                append(king_square | target << 6)
+
+            if checkers & (checkers - 1):
+                # double check, only the king can move
+                return moves
+
+            if checkers:
+                # capture the checker or block its line
+                targets &= checkers | BETWEEN[king_square * 64 + lsb(checkers)]
+            elif not captures_only:
+                self._castling_moves(color, them, king_square, occupied, moves)
+
+        for ty, bitboard in bitboards.items():
+            if ty == "king" or not bitboard:
+                continue
+
+            for square in iter_bits(bitboard):
+                allowed = targets & pins[square] if square in pins else targets
+
+                if ty == "pawn":
+                    self._pawn_moves(color, them, square, allowed, occupied, enemy, king, moves, captures_only)
+                    continue
+
+                if ty in LINE_KINDS:
+                    attacks = slider_attacks(ty, square, occupied) & allowed & captures
+                else:
+                    attacks = ATTACKS[ty][color][square] & allowed & captures
+                for target in iter_bits(attacks):
+                    append(square | target << 6)
+
+        return moves
+
+    def _pawn_moves(self, color, them, square, allowed, occupied, enemy, king, moves, captures_only=False):
+        """Appends the legal moves of the pawn on square, allowed masks in checks and pins."""
+        promotion_rank = PROMOTION_RANKS[color]
+
+        targets = []
+        for target in STEPS["pawn"][color][square]:
+            if captures_only and target >> 3 != promotion_rank:
+                continue
+            if not occupied & BITS[target]:
+                if allowed & BITS[target]:
+                    targets.append(target)
+                for jump in PAWN_DOUBLE_STEPS[color][square]:
+                    if not occupied & BITS[jump] and allowed & BITS[jump]:
+                        targets.append(jump)
+
+        for target in PAWN_CAPTURES[color][square]:
+            if enemy & allowed & BITS[target]:
+                targets.append(target)
+
+        for target in targets:
+            if target >> 3 == promotion_rank:
+                for promotion in PROMOTIONS:
+                    moves.append(square | target << 6 | PROMOTION_FLAGS[promotion] << 12)
+            else:
+                moves.append(square | target << 6)
+
+        # en passant is checked by clearing both pawns off the board, which covers every pin
+        if self.en_passant_available:
+            captured_position, behind = self.en_passant_available
+            captured = to_square(captured_position)
+            target = to_square(behind)
+            if target in PAWN_CAPTURES[color][square] and captured >> 3 == square >> 3 and\
+                    self._bitboards[them]["pawn"] & BITS[captured]:
+                if king:
+                    after = (occupied ^ BITS[square] ^ BITS[captured]) | BITS[target]
+                    if self.attackers_to(lsb(king), them, after) & ~BITS[captured]:
+                        return
+                moves.append(square | target << 6 | EN_PASSANT << 12)
+
+    def _castling_moves(self, color, them, king_square, occupied, moves):
+        """Appends the castling moves of color, whose king is not in check."""
+        rights = self.castling_rights
+        for i, (right_color, king_position, rook_position) in enumerate(CASTLING):
+            if right_color != color or not rights >> i & 1:
+                continue
+
+            rook_square = to_square(rook_position)
+            if BETWEEN[king_square * 64 + rook_square] & occupied:
+                continue
+
+            # the squares the king and rook end up on must be free too
+            rank = king_position[1]
+            king_target = to_square((6 if rook_position[0] > king_position[0] else 2, rank))
+            rook_target = to_square((5 if rook_position[0] > king_position[0] else 3, rank))
+            if (BITS[king_target] | BITS[rook_target]) & occupied & ~(BITS[king_square] | BITS[rook_square]):
+                continue
+
+            # the king may not pass through or land on an attacked square
+            if (BETWEEN[king_square * 64 + king_target] | BITS[king_target]) & self._attacked[them]:
+                continue
+
+            moves.append(king_square | rook_square << 6 | CASTLE << 12)
+
+    def _set(self, undo, key, piece):
+        """Sets or clears a square, journaling its previous piece in undo."""
+        undo.squares.append((key, self[key]))
+        if piece:
+            self[key] = piece
+        else:
+            del self[key]
+
+    def _apply_move(self, position, new_position, promotion=None):
+        """ Semi-unsafely moves a piece destroying any piece that is in the destination.
+            Returns the Undo record for the move, or None if nothing was moved.
+        """
         piece = self[position]
         other = self[new_position]
 
         # lets quit before we do anything if there's no piece to move
         if not piece:
-            return
+            return None
+
+        undo = Undo(move=(position, new_position) if promotion is None else (position, new_position, promotion),
+                    piece=piece, active_color=self.active_color, en_passant_available=self.en_passant_available,
+                    check=self._check, checkmate=self._checkmate, zobrist_key=self._zobrist,
+                    halfmove_clock=self.halfmove_clock, fullmove_number=self.fullmove_number)
+
+        # only kings and rooks moving or rooks being captured can change the castling rights
+        castling_rights = None
+        if piece.type in ["king", "rook"] or (other and other.type == "rook"):
+            castling_rights = self.castling_rights
 
         # check if the move is a castle, this presumes that it's a valid castle. (semi-unsafe)
         if piece.type in ["king", "rook"] and other and other.type in ["king", "rook"] and\
                 other.type != piece.type and other.color == piece.color:
-            del self[new_position]
-            del self[position]
-
-            # castle the king and rook
-            # TODO: should castle be stored in the pieces?
-            # right rook moving
-            if position[0] == 7:
-                king, rook = (5, 6)
-                castled = "kingside"
-            # left rook moving
-            elif position[0] == 0:
-                king, rook = (3, 2)
-                castled = "queenside"
-            # king
+            king_position, rook_position = (position, new_position) if piece.type == "king" else (new_position, position)
+            king, rook = self[king_position], self[rook_position]
+
+            # castle the king and rook, whichever of the two was picked up
+            if rook_position[0] > king_position[0]:
+                king_file, rook_file = (6, 5)
+                undo.castle = "kingside"
             else:
-                # moving right
-                if position[0] < new_position[0]:
-                    king, rook = (6, 5)
-                    castled = "kingside"
-                # moving left
-                else:
-                    king, rook = (2, 3)
-                    castled = "queenside"
+                king_file, rook_file = (2, 3)
+                undo.castle = "queenside"
 
-            other.has_moved = True
-            piece.has_moved = True
-            self[king if other.type == "king" else rook, position[1]] = other
-            self[king if piece.type == "king" else rook, position[1]] = piece
+            self._set(undo, king_position, None)
+            self._set(undo, rook_position, None)
+            self._set(undo, (king_file, king_position[1]), king)
+            self._set(undo, (rook_file, rook_position[1]), rook)
+            undo.has_moved.extend(((king, king.has_moved), (rook, rook.has_moved)))
+            king.has_moved = True
+            rook.has_moved = True
+
+            self.en_passant_available = False
+            landing = (king_file, king_position[1]) if piece is king else (rook_file, rook_position[1])
         else:
             # if king, you cannot take, only check and checkmate
             if other and other.type == "king":
-                return
-
-            # reset en passant state if not pawn moving.
-            # This is partially destructive and part of why this is a semi-unsafe move.
-            if piece.type != "pawn" and self.en_passant_available:
-                self.en_passant_available = False
+                return None
 
+            en_passant_available = False
             if piece.type == "pawn":
-                # TODO: check for promotions
                 # Jump + En Passant
                 if abs(new_position[1] - position[1]) == 2 and position in piece.initial_positions:
-                    self.en_passant_available = new_position, (position[0], position[1] + 1 if piece.color == "white" else position[1] - 1)
+                    en_passant_available = new_position, (position[0], position[1] + 1 if piece.color == "white" else position[1] - 1)
                 else:
                     # check if pawn is capturing en passant, en_passant_available[0] is the position of the pawn that can be captured
                     # en_passant_available[1] is the new position for the pawn that captures
                     vector = (new_position[0] - position[0],
-                            new_position[1] - position[1])
-                    logger.debug("Vector: ", vector, "Valid Captures: ", piece.valid_captures, "En Passant Available: ", self.en_passant_available)
+                              new_position[1] - position[1])
+                    logger.debug(f"Vector: {vector}, Valid Captures: {piece.valid_captures}, "
+                                 f"En Passant Available: {self.en_passant_available}")
                     if self.en_passant_available and new_position == self.en_passant_available[1] and vector in piece.valid_captures:
-                        del self[self.en_passant_available[0]]
-                        en_passanted = True
-                        # new position is actually behind the captured pawn
-                        
-                    self.en_passant_available = False    
-
-            # move the piece
-            del self[position]
-            self[new_position] = piece
+                        self._set(undo, self.en_passant_available[0], None)
+                        undo.en_passant = True
+                        undo.capture = True
+            self.en_passant_available = en_passant_available
+
+            # move the piece, promoting pawns that reach the last rank
+            self._set(undo, position, None)
+            if piece.type == "pawn" and new_position[1] == PROMOTION_RANKS[piece.color]:
+                promoted = Piece(piece.color, promotion or "queen")
+                promoted.has_moved = True
+                self._set(undo, new_position, promoted)
+            else:
+                self._set(undo, new_position, piece)
+            undo.has_moved.append((piece, piece.has_moved))
             piece.has_moved = True
 
-        # check if the move is a capture
-        if other:
-            capture = True
-
-        # check if king is threatened
-        # This si not working, presumably because valid moves isn't correct.
-        check_position = self.__find_check(new_position)
-        if check_position:
-            self._check = check_position
-            if self.__find_checkmate(new_position):
-                self._checkmate = check_position
+            # check if the move is a capture
+            if other:
+                undo.capture = True
+            landing = new_position
+
+        self.halfmove_clock = 0 if piece.type == "pawn" or undo.capture else self.halfmove_clock + 1
+        if piece.color == "black":
+            self.fullmove_number += 1
+
+        # the pieces were hashed by the setters, the rest of the position is hashed here
+        self._zobrist ^= en_passant_key(undo.en_passant_available) ^ en_passant_key(self.en_passant_available)
+        if castling_rights is not None:
+            self._zobrist ^= castling_key(castling_rights) ^ castling_key(self.castling_rights)
+
+        # check if the other king is threatened, and whether it has any way out
+        them = "black" if piece.color == "white" else "white"
+        king = self._bitboards[them]["king"]
+        if self._attacked[piece.color] & king:
+            self._check = POSITIONS[lsb(king)]
+            self._checkmate = self._check if not self.generate_move_array(them) else None
         else:
             self._check = None
             self._checkmate = None
 
-        # TODO: to append check/checkmate it must be checked here...
+        return undo
+
+    def make_move(self, position, new_position, promotion=None):
+        """ Makes a move for the side to move and passes the turn.
+
+            Returns the Undo record that `unmake_move` uses to restore the board exactly,
+            or None if the move could not be made.
+        """
+        undo = self._apply_move(position, new_position, promotion)
+        if undo is None:
+            return None
+
+        self.active_color = "black" if self.active_color == "white" else "white"
+        self._undo_stack.append(undo)
+        return undo
+
+    def unmake_move(self, undo=None):
+        """ Takes back the last move made by `make_move`. """
+        if undo is None:
+            undo = self._undo_stack.pop()
+        elif self._undo_stack and self._undo_stack[-1] is undo:
+            self._undo_stack.pop()
+        else:
+            raise ValueError("Moves must be unmade in reverse order")
+
+        for key, piece in reversed(undo.squares):
+            if piece:
+                self[key] = piece
+            else:
+                del self[key]
+
+        for piece, has_moved in undo.has_moved:
+            piece.has_moved = has_moved
+
+        self.active_color = undo.active_color
+        self.en_passant_available = undo.en_passant_available
+        self._check = undo.check
+        self._checkmate = undo.checkmate
+        self._zobrist = undo.zobrist_key
+        self.halfmove_clock = undo.halfmove_clock
+        self.fullmove_number = undo.fullmove_number
+
+    def move(self, position, new_position, update=False, promotion=None):
+        """ Semi-unsafely moves a piece destroying any piece that is in the destination.
+            This expects that the move is valid under chess rules. 
+            Returns the Undo record for the move, or None if nothing was moved.
+        """
+        undo = self._apply_move(position, new_position, promotion)
+        if undo is None:
+            return
+
+        piece = undo.piece
         self.move_history.append(generate_notation(
-            piece.type, piece.notation, position, new_position, capture=capture,
-            en_passant=en_passanted, check=self._check, checkmate=self._checkmate, castle=castled)
+            piece.type, piece.notation, position, new_position, capture=undo.capture,
+            en_passant=undo.en_passant, check=self._check, checkmate=self._checkmate, castle=undo.castle)
         )
+
+        return undo
+
+    def changed_positions(self, undo):
+        """ Returns the positions the last move, given by its undo, changed.
+
+            Besides the squares pieces left or landed on, this includes the squares behind
+            a jumped pawn that en passant became possible or impossible on.
+        """
+        changed = {position for position, _ in undo.squares}
+        for en_passant in (undo.en_passant_available, self.en_passant_available):
+            if en_passant:
+                changed.add(en_passant[1])
+        return changed
@@ -0,0 +1,85 @@
+""" Move and attack tables derived from `piece_dict` once at import time.
+
+    Every table is indexed by piece type, then color, then square and holds
+    square indices (see `pyss.game.board.bitboard`), so move generation only
+    does lookups instead of rebuilding and bounds checking candidates.
+"""
+from pyss.game.board.bitboard import BITS, COLORS, POSITIONS, to_square
+from pyss.game.piece import piece_dict
+
+
+def _relative_moves(ty, color, key="valid_relative_moves"):
+    moves = piece_dict[ty][key]
+    if isinstance(moves, dict):
+        moves = moves[color]
+    return moves
+
+
+def _on_board(x, y):
+    return 0 <= x <= 7 and 0 <= y <= 7
+
+
+def _build_rays(ty, color):
+    """Per square, one tuple of squares per direction ordered outward from the square."""
+    table = []
+    for x, y in POSITIONS:
+        rays = []
+        for dx, dy in _relative_moves(ty, color):
+            ray = []
+            for displacement in range(1, piece_dict[ty]["displacement"] + 1):
+                new_x, new_y = x + dx * displacement, y + dy * displacement
+                if not _on_board(new_x, new_y):
+                    break
+                ray.append(to_square((new_x, new_y)))
+            if ray:
+                rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return table
+
+
+def _build_steps(ty, color, key="valid_relative_moves"):
+    """Per square, the squares reachable by a single displacement."""
+    table = []
+    for x, y in POSITIONS:
+        table.append(tuple(to_square((x + dx, y + dy)) for dx, dy in _relative_moves(ty, color, key)
+                           if _on_board(x + dx, y + dy)))
+    return table
+
+
+def _build_double_steps(color):
+    """Per square, the two square pawn jump if the square is an initial pawn position."""
+    table = [() for _ in range(64)]
+    for x, y in piece_dict["pawn"]["initial_positions"][color]:
+        for dx, dy in _relative_moves("pawn", color):
+            if _on_board(x + dx * 2, y + dy * 2):
+                table[to_square((x, y))] += (to_square((x + dx * 2, y + dy * 2)),)
+    return table
+
+
+def _to_bitboards(table):
+    return [sum(BITS[square] for square in squares) for squares in table]
+
+
+SLIDERS = tuple(ty for ty in piece_dict if piece_dict[ty]["displacement"] > 1)
+LEAPERS = tuple(ty for ty in piece_dict if ty != "pawn" and ty not in SLIDERS)
+
+# sliding rays, e.g. RAYS["rook"]["white"][0] == ((1, 2, ..., 7), (8, 16, ..., 56))
+RAYS = {ty: {color: _build_rays(ty, color) for color in COLORS} for ty in SLIDERS}
+
+# single displacement targets for knights, kings and pawn pushes
+STEPS = {ty: {color: _build_steps(ty, color) for color in COLORS} for ty in LEAPERS + ("pawn",)}
+PAWN_DOUBLE_STEPS = {color: _build_double_steps(color) for color in COLORS}
+PAWN_CAPTURES = {color: _build_steps("pawn", color, "valid_captures") for color in COLORS}
+
+# (color, king position, rook position) per castling right, kingside first as in FEN's KQkq
+CASTLING = tuple((color, tuple(piece_dict["king"]["initial_positions"][color][0]), tuple(rook))
+                 for color in COLORS
+                 for rook in sorted(piece_dict["rook"]["initial_positions"][color], key=lambda p: -p[0]))
+
+# the rank a pawn promotes on, the last one in its direction of travel
+PROMOTION_RANKS = {color: 7 if _relative_moves("pawn", color)[0][1] > 0 else 0 for color in COLORS}
+PROMOTIONS = ("queen", "rook", "bishop", "knight")
+
+# attacked squares as bitboards for the non-sliding pieces
+ATTACKS = {ty: {color: _to_bitboards(STEPS[ty][color]) for color in COLORS} for ty in LEAPERS}
+ATTACKS["pawn"] = {color: _to_bitboards(PAWN_CAPTURES[color]) for color in COLORS}
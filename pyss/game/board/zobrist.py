@@ -0,0 +1,37 @@
+""" Zobrist keys for incremental position hashing.
+
+    A position key is the XOR of one random 64-bit number per (color, type,
+    square) occupied, plus the side to move, each castling right still
+    available and the file of a pending en passant capture. The numbers come
+    from a fixed seed so keys are stable between runs and processes.
+"""
+import random
+
+from pyss.game.board.bitboard import COLORS, TYPES
+
+
+_rng = random.Random(0x5059_5353)
+
+PIECE_KEYS = {color: {ty: tuple(_rng.getrandbits(64) for _ in range(64)) for ty in TYPES} for color in COLORS}
+# XORed in while black is to move
+SIDE_KEY = _rng.getrandbits(64)
+# one key per castling right, in the order of tables.CASTLING
+CASTLING_KEYS = tuple(_rng.getrandbits(64) for _ in range(4))
+# one key per file of the square an en passant capture lands on
+EN_PASSANT_KEYS = tuple(_rng.getrandbits(64) for _ in range(8))
+
+
+def castling_key(rights):
+    """Returns the combined key of a castling rights bitmask."""
+    key = 0
+    for i, right_key in enumerate(CASTLING_KEYS):
+        if rights >> i & 1:
+            key ^= right_key
+    return key
+
+
+def en_passant_key(en_passant_available):
+    """Returns the key of a PlayableBoard.en_passant_available value."""
+    if not en_passant_available:
+        return 0
+    return EN_PASSANT_KEYS[en_passant_available[1][0]]
@@ -35,7 +35,25 @@ def notation_to_position(notation: str):
         (tuple): The position of the notation
             example: (0, 0)
     """
-    return (get_file(notation), ord(notation[0]) - ord('a'))
+    return (ord(notation[0]) - ord('a'), int(notation[1:]) - 1)
+
+
+def long_algebraic(position, new_position, promotion=None):
+    """Returns a move in long algebraic notation as UCI engines print it
+
+    Args:
+        position (tuple): Where the piece moves from
+        new_position (tuple): Where the piece moves to
+        promotion (str): The piece type a pawn promotes to, if any
+
+    Returns:
+        (str): The move
+            example: "e2e4" or "e7e8q"
+    """
+    notation = f"{position_to_notation(position)}{position_to_notation(new_position)}"
+    if promotion:
+        notation += "n" if promotion == "knight" else promotion[0]
+    return notation
 
 
 def generate_notation(piece_type, piece_note, position,
@@ -69,4 +87,44 @@ def generate_notation(piece_type, piece_note, position,
 
 
 def parse_notation(game_notes: str):
-    pass
+    """Returns a description of each full move of a game's movetext
+
+    Args:
+        game_notes (str): The movetext, in SAN or long algebraic notation
+            example: "1.f2-f4\te7-e5\n2.f4xe5\td7-d6"
+
+    Returns:
+        (list): A line per full move, then " ... check" or " ... checkmate" if the game ends so
+            example: ["1. f2 pawn moves to f4, e7 pawn moves to e5", "2. f4 pawn captures e5, d7 pawn moves to d6"]
+    """
+    # the board imports this module
+    from pyss.game.board.playable import PlayableBoard
+    from pyss.game.pgn import parse_game
+
+    game = parse_game(game_notes)
+    board = PlayableBoard.from_fen(game.fen)
+    notes = []
+    for move in game.moves:
+        position, new_position = move[:2]
+        piece, other = board[position], board[new_position]
+        if other and other.color == piece.color:
+            side = "kingside" if new_position[0] > position[0] else "queenside"
+            note = f"{position_to_notation(position)} king castles {side}"
+        else:
+            capture = other or piece.type == "pawn" and position[0] != new_position[0]
+            note = f"{position_to_notation(position)} {piece.type} " \
+                   f"{'captures' if capture else 'moves to'} {position_to_notation(new_position)}"
+            if len(move) > 2:
+                note += f" and promotes to {move[2]}"
+
+        if board.active_color == "white":
+            notes.append(f"{board.fullmove_number}. {note}")
+        elif notes:
+            notes[-1] += f", {note}"
+        else:
+            notes.append(f"{board.fullmove_number}. ..., {note}")
+        board.make_move(*move)
+
+    if board.in_check(board.active_color):
+        notes.append(" ... checkmate" if not board.generate_move_array() else " ... check")
+    return notes
@@ -0,0 +1,296 @@
+""" Portable Game Notation, read a game at a time.
+
+    `read_pgn` streams the games of a file of any size, keeping only the game
+    being read in memory, and replays each on a PlayableBoard to resolve its
+    moves. Moves may be SAN ("Nbd7", "exd6", "O-O-O", "a8=Q+") or long
+    algebraic, with or without the piece letter ("Bf8xd6", "e2-e4", "e7e8q").
+
+    `ingest` splits a file at game boundaries into shards and reads them on a
+    process pool, calling a function on each game.
+
+    Usage:
+        games = sum(1 for _ in read_pgn("games.pgn"))
+        results = Counter(ingest("games.pgn", result_of, processes=8))
+"""
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from pyss.game.board.fen import STARTING_FEN, TYPES, load_fen
+from pyss.game.board.moves import CASTLE, MOVES, PROMOTION
+from pyss.game.board.playable import PlayableBoard
+from pyss.game.board.tables import PROMOTIONS
+from pyss.game.notation import notation_to_position
+
+
+logger = logging.getLogger(__name__)
+
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+_TAG = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# comments, variations, NAGs, results and move numbers, everything else is a move
+_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|[()]|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};$]+')
+_SAN = re.compile(r'([KQRBN])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([QRBNqrbn]))?$')
+_LONG = re.compile(r'[KQRBN]?([a-h][1-8])[-x]?([a-h][1-8])(?:=?([QRBNqrbn]))?$')
+
+
+@dataclass
+class Game:
+    """ A game as read from PGN: its tags, starting position and moves as `make_move` tuples. """
+    headers: dict = field(default_factory=dict)
+    fen: str = STARTING_FEN
+    moves: list = field(default_factory=list)
+    result: str = "*"
+
+    def board(self):
+        """Returns a new board with the game played out on it"""
+        board = PlayableBoard.from_fen(self.fen)
+        for move in self.moves:
+            board.make_move(*move)
+        return board
+
+
+def parse_move(board, token):
+    """ Returns a move of the side to move on board, in SAN or long algebraic notation, as a `make_move` tuple.
+
+        Raises ValueError if it isn't legal or is ambiguous.
+    """
+    san = token.rstrip("+#!?")
+    color = board.active_color
+
+    legal = board.generate_move_array(color)
+
+    if san.replace("0", "O") in ("O-O", "O-O-O"):
+        rook_file = 7 if len(san) == 3 else 0
+        for code in legal:
+            if code >> 12 == CASTLE and MOVES[code][1][0] == rook_file:
+                return MOVES[code]
+        raise ValueError(f"Illegal castle {token!r}")
+
+    match = _LONG.match(san)
+    if match:
+        position, new_position = notation_to_position(match[1]), notation_to_position(match[2])
+        piece = board[position]
+        # engines castle by stepping the king two files
+        if piece and piece.type == "king" and abs(new_position[0] - position[0]) == 2:
+            new_position = (7 if new_position[0] > position[0] else 0, position[1])
+        promotion = TYPES[match[3].lower()] if match[3] else None
+        if piece and piece.type == "pawn" and promotion is None and new_position[1] in (0, 7):
+            promotion = "queen"
+
+        move = (position, new_position) if promotion is None else (position, new_position, promotion)
+        if any(MOVES[code] == move for code in legal):
+            return move
+        raise ValueError(f"Illegal move {token!r}")
+
+    match = _SAN.match(san)
+    if not match:
+        raise ValueError(f"Invalid move {token!r}")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    piece_type = TYPES[letter.lower()] if letter else "pawn"
+    target = notation_to_position(target)
+    promotion = TYPES[promotion.lower()] if promotion else None
+
+    found = []
+    for code in legal:
+        flags = code >> 12
+        if flags == CASTLE:
+            continue
+        move = MOVES[code]
+        position, new_position = move[:2]
+        if new_position != target or board[position].type != piece_type:
+            continue
+        if from_file and position[0] != ord(from_file) - ord('a'):
+            continue
+        if from_rank and position[1] != int(from_rank) - 1:
+            continue
+        if flags >= PROMOTION and PROMOTIONS[flags - PROMOTION] != (promotion or "queen"):
+            continue
+        found.append(move)
+
+    if len(found) != 1:
+        raise ValueError(f"{'Ambiguous' if found else 'Illegal'} move {token!r}")
+    return found[0]
+
+
+def split_games(lines):
+    """ Yields the text of each game from an iterable of PGN lines.
+
+        A game ends where the tags of the next one begin, outside of a comment.
+    """
+    game = []
+    in_moves = False
+    in_comment = False
+    for line in lines:
+        stripped = line.strip()
+        if not in_comment and stripped.startswith("[") and _TAG.match(stripped):
+            if in_moves:
+                yield "".join(game)
+                game, in_moves = [], False
+        elif stripped and not in_comment:
+            in_moves = True
+
+        # a line comment hides braces, unless it is itself inside a comment
+        code = line if in_comment else line.split(";", 1)[0]
+        opened, closed = code.rfind("{"), code.rfind("}")
+        if opened != closed:
+            in_comment = opened > closed
+        game.append(line)
+
+    if any(line.strip() for line in game):
+        yield "".join(game)
+
+
+def parse_game(text, board=None):
+    """ Returns the Game in a PGN text, its moves replayed on board or a new PlayableBoard.
+
+        Comments, variations and NAGs are skipped. Raises ValueError on an illegal move.
+    """
+    headers = {}
+    movetext = []
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        match = _TAG.match(stripped) if stripped.startswith("[") and not movetext else None
+        if match:
+            headers[match[1]] = match[2].replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped and not stripped.startswith("%"):
+            movetext.append(line)
+
+    game = Game(headers=headers, fen=headers.get("FEN", STARTING_FEN))
+    if board is None:
+        board = PlayableBoard(initialize=False)
+    load_fen(board, game.fen)
+
+    depth = 0
+    for token in _TOKEN.findall("".join(movetext)):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(depth - 1, 0)
+        elif depth or token[0] in "{;$" or token.rstrip(".").isdigit() or token == "e.p.":
+            continue
+        elif token in RESULTS:
+            game.result = token
+        else:
+            try:
+                move = parse_move(board, token)
+            except ValueError as e:
+                raise ValueError(f"{e} after {len(game.moves)} plies of {headers or 'a game'}") from None
+            board.make_move(*move)
+            game.moves.append(move)
+
+    return game
+
+
+def _lines(source):
+    if isinstance(source, str) or hasattr(source, "__fspath__"):
+        with open(source, encoding="utf-8", errors="replace") as f:
+            yield from f
+    else:
+        yield from source
+
+
+def read_pgn(source, skip_errors=False):
+    """ Yields each Game of a PGN file, given as a path, the open file or any iterable of lines.
+
+        With skip_errors a game with an illegal move is logged and left out instead of raising.
+    """
+    board = PlayableBoard(initialize=False)
+    for text in split_games(_lines(source)):
+        try:
+            yield parse_game(text, board)
+        except ValueError as e:
+            if not skip_errors:
+                raise
+            logger.warning(f"Skipped a game: {e}")
+
+
+def read_positions(source, skip_errors=False):
+    """ Yields (game, board) for every position of every game, from the start position on.
+
+        The same board is played forward and reused between games, copy it to keep a position.
+    """
+    board = PlayableBoard(initialize=False)
+    for game in read_pgn(source, skip_errors):
+        load_fen(board, game.fen)
+        yield game, board
+        for move in game.moves:
+            board.make_move(*move)
+            yield game, board
+
+
+_BYTES_TAG = re.compile(_TAG.pattern.encode())
+
+
+def _at_game_start(previous, line):
+    # a tag after movetext, a tag alone on a line within a comment would fool it
+    return bool(previous) and not _BYTES_TAG.match(previous) and bool(_BYTES_TAG.match(line))
+
+
+def shard_offsets(path, shards):
+    """Returns the byte offsets splitting a PGN file into up to shards ranges that each start at a game"""
+    size = os.path.getsize(path)
+    offsets = [0]
+    with open(path, "rb") as f:
+        for i in range(1, shards):
+            target = max(size * i // shards, offsets[-1])
+            f.seek(target)
+            # the first line read may be cut, it only serves as the line before
+            previous = f.readline().strip() if target else b""
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    offset = size
+                    break
+                stripped = line.strip()
+                if _at_game_start(previous, stripped):
+                    break
+                if stripped:
+                    previous = stripped
+
+            if offset >= size:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+    offsets.append(size)
+    return offsets
+
+
+def _ingest_shard(path, start, end, function):
+    results = []
+    with open(path, "rb") as f:
+        f.seek(start)
+
+        def lines():
+            while f.tell() < end:
+                line = f.readline()
+                if not line:
+                    return
+                yield line.decode("utf-8", errors="replace")
+
+        for game in read_pgn(lines(), skip_errors=True):
+            result = function(game)
+            if result is not None:
+                results.append(result)
+    return results
+
+
+def ingest(path, function, processes=None, shards=None):
+    """ Yields function(game) for every game of a PGN file, read in shards on a process pool.
+
+        function must be picklable, e.g. defined at module level, results of None are left out.
+        Results come shard by shard as they finish, not in file order. Games with illegal
+        moves are skipped.
+    """
+    processes = processes or os.cpu_count() or 1
+    offsets = shard_offsets(path, shards or processes * 4)
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_ingest_shard, os.fspath(path), start, end, function)
+                   for start, end in zip(offsets, offsets[1:])]
+        for future in as_completed(futures):
+            yield from future.result()
@@ -2,7 +2,7 @@ import logging
 import yaml
 import os
 
-from dataclasses import dataclass, field
+from dataclasses import dataclass
 from random import choice
 from typing import Literal
 
@@ -20,49 +20,90 @@ except Exception as e:
     print("Using default piece_dict!")
 
 
-@dataclass
+@dataclass(frozen=True)
+class PieceData:
+    """ The static data of a (type, color) out of piece_dict, shared by every such piece. """
+    notation: str
+    value: int
+    unicode: str
+    initial_positions: tuple
+    displacement: int
+    # need to be transformed into real moves by multiply with displacement
+    valid_relative_moves: tuple
+    # pawn only
+    valid_captures: tuple = ()
+
+    @staticmethod
+    def from_piece_dict(ty, color):
+        data = piece_dict[ty]
+        valid_relative_moves = data["valid_relative_moves"]
+        valid_captures = ()
+        if ty == "pawn":
+            valid_relative_moves = valid_relative_moves[color]
+            valid_captures = tuple(tuple(m) for m in data["valid_captures"][color])
+
+        return PieceData(notation=data["notation"],
+                         value=data["value"],
+                         unicode=data["unicode"][color],
+                         initial_positions=tuple(tuple(p) for p in data["initial_positions"][color]),
+                         displacement=data["displacement"],
+                         valid_relative_moves=tuple(tuple(m) for m in valid_relative_moves),
+                         valid_captures=valid_captures)
+
+
+PIECE_DATA = {(ty, color): PieceData.from_piece_dict(ty, color)
+              for ty in piece_dict for color in ("white", "black")}
+
+
 class Piece:
+    """ A piece on the board.
+
+        Instances only hold their color, type and whether they have moved, the rest
+        is looked up in the PieceData interned for their (type, color).
+    """
     COLORS = Literal["white", "black"]
     TYPES = Literal["pawn", "rook", "knight", "bishop", "queen", "king"]
 
     POSITION = tuple[int, int]
 
-    color: COLORS
-    type: TYPES
+    __slots__ = ("color", "type", "has_moved")
 
-    notation: str = field(init=False)
-    value: int = field(init=False)
-    unicode: str = field(init=False)
-    initial_positions: list[POSITION] = field(init=False)
-    displacement: int = field(init=False)
-    value: int = field(init=False)
+    def __init__(self, color: COLORS, type: TYPES, has_moved: bool = False):
+        self.color = color
+        self.type = type
+        self.has_moved = has_moved
 
-    # need to be transformed into real moves by multiply with displacement
-    valid_relative_moves: list[POSITION] = field(init=False)
+    @property
+    def data(self) -> PieceData:
+        return PIECE_DATA[self.type, self.color]
+
+    @property
+    def notation(self) -> str:
+        return PIECE_DATA[self.type, self.color].notation
 
-    def __post_init__(self):
-        valid_relative_moves = piece_dict[self.type]["valid_relative_moves"]
-        if self.type == "pawn":
-            valid_relative_moves = valid_relative_moves[self.color]
-            # valid_captures is pawn only! TODO?
-            valid_captures = piece_dict[self.type]["valid_captures"][self.color]
-            self.valid_captures = valid_captures
+    @property
+    def value(self) -> int:
+        return PIECE_DATA[self.type, self.color].value
 
-        logger.debug(f"Piece.__post_init__(): {self.color} {self.type}\n"
-                     f"\tvalid_relative_moves: {valid_relative_moves}\n")
+    @property
+    def unicode(self) -> str:
+        return PIECE_DATA[self.type, self.color].unicode
 
-        # Set the notation, unicode, initial_positions, valid_relative_moves,
-        # valid_relative_captures, displacement, and value
-        self.notation = piece_dict[self.type]["notation"]
-        self.unicode = piece_dict[self.type]["unicode"][self.color]
-        self.initial_positions = piece_dict[self.type]["initial_positions"][self.color]
-        self.valid_relative_moves = valid_relative_moves
-        self.displacement = piece_dict[self.type]["displacement"]
-        self.value = piece_dict[self.type]["value"]
+    @property
+    def initial_positions(self) -> tuple[POSITION, ...]:
+        return PIECE_DATA[self.type, self.color].initial_positions
 
-        self._valid_moves = None
+    @property
+    def displacement(self) -> int:
+        return PIECE_DATA[self.type, self.color].displacement
 
-        self.has_moved = False
+    @property
+    def valid_relative_moves(self) -> tuple[POSITION, ...]:
+        return PIECE_DATA[self.type, self.color].valid_relative_moves
+
+    @property
+    def valid_captures(self) -> tuple[POSITION, ...]:
+        return PIECE_DATA[self.type, self.color].valid_captures
 
     @staticmethod
     def random_piece():
@@ -82,6 +123,14 @@ class Piece:
                 diff[field] = getattr(other, field)
         return diff
 
+    def __eq__(self, other):
+        if not isinstance(other, Piece):
+            return NotImplemented
+        return self.color == other.color and self.type == other.type
+
+    def __repr__(self):
+        return f"Piece(color={self.color!r}, type={self.type!r}, has_moved={self.has_moved!r})"
+
     def __str__(self):
         return self.notation.upper() if self.color == "white" else self.notation.lower()
 
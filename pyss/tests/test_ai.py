@@ -1,5 +1,80 @@
+import threading
+
 import pytest
 
+from pyss.ai.book import ENTRY, OpeningBook
+from pyss.ai.simple import MATE, SimpleEngine, evaluate
+from pyss.game.board.depth import Chessboard
+from pyss.game.board.fen import load_fen
+
 
 class TestSuite:
-    pass
+    def test_evaluate_initial(self):
+        assert evaluate(Chessboard()) == 0
+
+    def test_mate_in_one(self):
+        board = load_fen(Chessboard(), "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        key = board.zobrist_key
+
+        result = SimpleEngine(board).search(depth=3)
+        assert result.move == ((0, 0), (0, 7))
+        assert result.value == MATE - 1 and result.mate == 1
+        # searched in place, but nothing was left behind
+        assert board.zobrist_key == key and board.active_color == "white"
+
+    def test_wins_material(self):
+        board = load_fen(Chessboard(), "4k3/8/8/3q4/8/8/3R4/3K4 w - - 0 1")
+        result = SimpleEngine(board).search(depth=3)
+        assert result.move == ((3, 1), (3, 4))
+        assert result.pv[0] == result.move
+
+    def test_iterative_deepening_limits(self):
+        board = Chessboard()
+        engine = SimpleEngine(board, check_every=64)
+
+        result = engine.search(depth=3)
+        assert result.depth == 3 and result.move in board.generate_legal_moves()
+
+        result = engine.search(depth=50, nodes=500)
+        assert 1 <= result.depth < 50 and result.move in board.generate_legal_moves()
+
+        # stopping from another thread keeps the last completed iteration
+        timer = threading.Timer(0.2, engine.stop)
+        timer.start()
+        result = engine.search(depth=50)
+        timer.join()
+        assert result.depth < 50 and result.move is not None
+        assert board.zobrist_key == board.compute_zobrist_key()
+
+    def test_parallel_search(self):
+        board = load_fen(Chessboard(hash_mb=1), "6k1/5ppp/8/8/8/8/5PPP/R5K1 w - - 0 1")
+        key = board.zobrist_key
+
+        engine = SimpleEngine(board)
+        result = engine.search(depth=3, workers=2)
+        assert result.move == ((0, 0), (0, 7)) and result.mate == 1
+        assert board.zobrist_key == key
+        # the board's own table is back in place once the shared one is gone
+        assert engine.table is board.transposition_table
+
+    def test_opening_book(self, tmp_path):
+        board = Chessboard()
+        key = board.polyglot_key
+        # to | from << 6, e2e4, d2d4 and an illegal e2e5
+        entries = [(key, 28 | 12 << 6, 3, 0), (key, 27 | 11 << 6, 1, 0), (key, 36 | 12 << 6, 9, 0),
+                   (key - 1, 28 | 12 << 6, 5, 0), (key + 1, 27 | 11 << 6, 5, 0)]
+        (tmp_path / "book.bin").write_bytes(b"".join(ENTRY.pack(*entry) for entry in sorted(entries)))
+
+        with OpeningBook(tmp_path / "book.bin", seed=1) as book:
+            assert len(book) == 5 and len(book.entries(key)) == 3
+            assert sorted(book.moves(board)) == [(((3, 1), (3, 3)), 1), (((4, 1), (4, 3)), 3)]
+            assert book.choose(board, best=True) == ((4, 1), (4, 3))
+            assert {book.choose(board) for _ in range(50)} == {((4, 1), (4, 3)), ((3, 1), (3, 3))}
+
+            result = SimpleEngine(board, book=book).search(depth=3)
+            assert result.depth == 0 and result.nodes == 0 and result.move in [((4, 1), (4, 3)), ((3, 1), (3, 3))]
+
+            # out of book the engine searches as usual
+            board.make_move((6, 0), (5, 2))
+            assert book.choose(board) is None
+            assert SimpleEngine(board, book=book).search(depth=1).depth == 1
@@ -1,9 +1,343 @@
+import random
+
 import pytest
 
+from pyss.game.board.bitboard import BITS, to_square
+from pyss.game.board.fen import STARTING_FEN, parse_epd, read_epd
+from pyss.game.board.moves import CASTLE, MOVES, PROMOTION_FLAGS, decode_move, encode_move, move_code, move_flags
 from pyss.game.board.playable import PlayableBoard
+from pyss.game.board.polyglot import decode_polyglot_move
+from pyss.game.board.tables import PAWN_DOUBLE_STEPS, RAYS, STEPS
+from pyss.game.notation import notation_to_position
+from pyss.game.piece import Piece
+
+
+def assert_bitboards_match(board):
+    for i in range(8):
+        for j in range(8):
+            piece = board[i, j]
+            bit = BITS[to_square((i, j))]
+            for color, by_type in board.bitboards.items():
+                for ty, bb in by_type.items():
+                    expected = bool(piece and piece.color == color and piece.type == ty)
+                    assert bool(bb & bit) == expected
+            assert bool(board.occupied & bit) == bool(piece)
 
 
 class TestSuite:
     @pytest.mark.skip
     def test_board(self):
         pass
+
+    def test_bitboards_initial(self):
+        board = PlayableBoard()
+
+        assert board.occupancy['white'] == 0xFFFF
+        assert board.occupancy['black'] == 0xFFFF << 48
+        assert board.bitboards['white']['pawn'] == 0xFF00
+        assert_bitboards_match(board)
+
+    def test_bitboards_follow_moves(self):
+        board = PlayableBoard()
+        board.move((4, 1), (4, 3))
+        board.move((3, 6), (3, 4))
+        board.move((4, 3), (3, 4))
+        del board[0, 0]
+
+        assert_bitboards_match(board)
+        assert len(board.by_color['black']) == 15
+        assert len(board.active_pieces) == 30
+
+    def test_tables(self):
+        assert STEPS['knight']['white'][0] == (17, 10)
+        assert RAYS['rook']['black'][0] == ((1, 2, 3, 4, 5, 6, 7), (8, 16, 24, 32, 40, 48, 56))
+        assert PAWN_DOUBLE_STEPS['white'][to_square((4, 1))] == (to_square((4, 3)),)
+        assert PAWN_DOUBLE_STEPS['white'][to_square((4, 2))] == ()
+
+    def test_valid_moves_initial(self):
+        board = PlayableBoard()
+
+        assert sorted(board.get_valid_moves((4, 1))) == [(4, 2), (4, 3)]
+        assert sorted(board.get_valid_moves((6, 0))) == [(5, 2), (7, 2)]
+        assert board.get_valid_moves((2, 0)) == []
+        assert sum(len(board.get_valid_moves(p[1])) for p in board.by_color['black']) == 20
+
+    def test_pawn_captures_when_push_blocked(self):
+        board = PlayableBoard()
+        board.move((4, 1), (4, 3))
+        board.move((4, 6), (4, 4))
+        board.move((3, 6), (3, 5))
+        board.move((3, 5), (3, 4))
+
+        assert sorted(board.get_valid_moves((4, 3))) == [(3, 4)]
+
+    def test_make_unmake_restores(self):
+        def snapshot(board):
+            return ([[(id(p), p.has_moved) if p else None for p in row] for row in board.board],
+                    board.active_color, board.en_passant_available, board._check, board._checkmate,
+                    {color: dict(bbs) for color, bbs in board.bitboards.items()}, dict(board.occupancy),
+                    dict(board.active_pieces),
+                    {color: set(pieces) for color, pieces in board.by_color.items()})
+
+        rng = random.Random(4)
+        board = PlayableBoard()
+        for _ in range(40):
+            before = snapshot(board)
+            moves = [(p, m) for _, p in board.by_color[board.active_color] for m in board.get_valid_moves(p)]
+            for move in moves:
+                undo = board.make_move(*move)
+                if undo is not None:
+                    board.unmake_move(undo)
+                assert snapshot(board) == before
+
+            rng.shuffle(moves)
+            while board.make_move(*moves.pop()) is None:
+                pass
+
+    def test_castling(self):
+        board = PlayableBoard()
+        for position in [(5, 0), (6, 0), (1, 7), (2, 7), (3, 7)]:
+            del board[position]
+
+        assert (7, 0) in board.get_valid_moves((4, 0))
+        board.make_move((4, 0), (7, 0))
+        assert board[6, 0].type == "king" and board[5, 0].type == "rook"
+
+        # picking up the rook castles the same way
+        board.make_move((0, 7), (4, 7))
+        assert board[2, 7].type == "king" and board[3, 7].type == "rook"
+
+        board.unmake_move()
+        board.unmake_move()
+        assert board[4, 0].type == "king" and not board[4, 0].has_moved
+        assert board[7, 0].type == "rook" and not board[7, 0].has_moved
+
+    def test_en_passant_and_promotion(self):
+        board = PlayableBoard()
+        board.move((4, 1), (4, 3))
+        board.move((0, 6), (0, 5))
+        board.move((4, 3), (4, 4))
+        undo = board.make_move((3, 6), (3, 4))
+
+        assert (3, 5) in board.get_valid_moves((4, 4))
+        board.make_move((4, 4), (3, 5))
+        assert board[3, 4] is None and board[3, 5].color == "white"
+        board.unmake_move()
+        assert board[3, 4].color == "black" and board[3, 5] is None
+
+        board.unmake_move(undo)
+        del board[1, 7]
+        del board[1, 6]
+        board[1, 6] = Piece("white", "pawn")
+        undo = board.make_move((1, 6), (1, 7), promotion="knight")
+        assert board[1, 7].type == "knight" and board[1, 7].color == "white"
+        board.unmake_move(undo)
+        assert board[1, 6].type == "pawn" and board[1, 7] is None
+
+    def test_zobrist_incremental(self):
+        rng = random.Random(5)
+        board = PlayableBoard()
+        for _ in range(60):
+            assert board.zobrist_key == board.compute_zobrist_key()
+            moves = [(p, m) for _, p in board.by_color[board.active_color] for m in board.get_valid_moves(p)]
+            for move in moves:
+                key = board.zobrist_key
+                undo = board.make_move(*move)
+                if undo is not None:
+                    assert board.zobrist_key == board.compute_zobrist_key()
+                    board.unmake_move(undo)
+                assert board.zobrist_key == key
+
+            rng.shuffle(moves)
+            while board.make_move(*moves.pop()) is None:
+                pass
+
+    def test_zobrist_transposition(self):
+        board = PlayableBoard()
+        for move in [((6, 0), (5, 2)), ((6, 7), (5, 5)), ((1, 0), (2, 2))]:
+            board.make_move(*move)
+        key = board.zobrist_key
+
+        board = PlayableBoard()
+        for move in [((1, 0), (2, 2)), ((6, 7), (5, 5)), ((6, 0), (5, 2))]:
+            board.make_move(*move)
+        assert board.zobrist_key == key
+
+        board.make_move((1, 7), (2, 5))
+        assert board.zobrist_key != key
+        board.unmake_move()
+        assert board.zobrist_key == key
+
+    def test_legal_moves_checkmate(self):
+        board = PlayableBoard()
+        assert len(board.generate_legal_moves("white")) == 20
+
+        # fool's mate
+        for move in [((5, 1), (5, 2)), ((4, 6), (4, 4)), ((6, 1), (6, 3)), ((3, 7), (7, 3))]:
+            board.make_move(*move)
+
+        assert board.in_check("white")
+        assert board._check == (4, 0)
+        assert board._checkmate == (4, 0)
+        assert board.generate_legal_moves() == []
+
+        board.unmake_move()
+        assert board._check is None and not board.in_check("white")
+
+    def test_legal_moves_pins_and_evasions(self):
+        board = PlayableBoard()
+        board.reset(no_initial_pieces=True)
+        board[4, 0] = Piece("white", "king")
+        board[4, 1] = Piece("white", "rook")
+        board[3, 1] = Piece("white", "knight")
+        board[4, 7] = Piece("black", "rook")
+        board[0, 4] = Piece("black", "bishop")
+        board[0, 7] = Piece("black", "king")
+
+        moves = board.generate_legal_moves("white")
+        # the rook may only slide along the pin, the knight may not move at all
+        assert sorted(m[1] for m in moves if m[0] == (4, 1)) == [(4, 2), (4, 3), (4, 4), (4, 5), (4, 6), (4, 7)]
+        assert not [m for m in moves if m[0] == (3, 1)]
+
+        del board[4, 1]
+        moves = board.generate_legal_moves("white")
+        # in check from the rook the king can't stay on the e-file, the knight can't block
+        assert sorted(m[1] for m in moves if m[0] == (4, 0)) == [(3, 0), (5, 0), (5, 1)]
+        assert not [m for m in moves if m[0] == (3, 1)]
+
+    def test_castling_through_check(self):
+        board = PlayableBoard()
+        for position in [(5, 0), (6, 0), (5, 1)]:
+            del board[position]
+        assert ((4, 0), (7, 0)) in board.generate_legal_moves("white")
+
+        board[5, 4] = Piece("black", "rook")
+        assert ((4, 0), (7, 0)) not in board.generate_legal_moves("white")
+        assert (7, 0) not in board.get_legal_moves((4, 0))
+
+    def test_attack_maps_incremental(self):
+        def snapshot(board):
+            return {color: list(counts) for color, counts in board.attack_counts.items()}, \
+                dict(board._attacked)
+
+        rng = random.Random(11)
+        board = PlayableBoard()
+        assert board.attacked_squares("white") == 0xFF_FF_7E
+        assert board.attack_counts["white"][to_square((5, 2))] == 3
+
+        for _ in range(40):
+            maps = snapshot(board)
+            board._init_attack_maps()
+            assert snapshot(board) == maps
+
+            moves = board.generate_legal_moves()
+            if not moves:
+                break
+            undo = board.make_move(*rng.choice(moves))
+            board.unmake_move(undo)
+            assert snapshot(board) == maps
+            board.make_move(*rng.choice(moves))
+
+        board = PlayableBoard()
+        board.make_move((4, 1), (4, 3))
+        assert board.is_attacked((7, 4), "white") and not board.is_attacked((7, 4), "black")
+
+    def test_move_array(self):
+        board = PlayableBoard()
+        moves = board.generate_move_array()
+        assert moves.typecode == "H" and len(moves) == 20
+        assert encode_move(to_square((6, 0)), to_square((5, 2))) in moves
+        assert [decode_move(move) for move in moves] == board.generate_legal_moves()
+
+        board = PlayableBoard()
+        board.reset(no_initial_pieces=True)
+        board[4, 0] = Piece("white", "king")
+        board[7, 0] = Piece("white", "rook")
+        board[1, 6] = Piece("white", "pawn")
+        board[0, 7] = Piece("black", "king")
+        flags = sorted(move_flags(move) for move in board.generate_move_array() if move_flags(move))
+        assert flags == [CASTLE] + sorted(PROMOTION_FLAGS.values())
+        assert all(MOVES[move_code(MOVES[move])] == MOVES[move] for move in board.generate_move_array())
+        assert (4, 0) in board.get_legal_moves((7, 0))
+
+        # captures and promotions only, so no castling and no quiet king or rook moves
+        assert sorted(board.generate_move_array(captures_only=True)) == sorted(
+            move for move in board.generate_move_array() if move_flags(move) in PROMOTION_FLAGS.values())
+
+        board = PlayableBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        enemy = board.occupancy["black"]
+        assert sorted(board.generate_move_array(captures_only=True)) == sorted(
+            move for move in board.generate_move_array() if enemy & BITS[move >> 6 & 0x3F])
+
+    def test_polyglot_key(self):
+        # the reference keys of the Polyglot format
+        board = PlayableBoard()
+        assert board.polyglot_key == 0x463b96181691fc9c
+        for move, key in [("e2e4", 0x823c9b50fd114196), ("d7d5", 0x0756b94461c50fb0), ("e4e5", 0x662fafb965db29d4),
+                          ("f7f5", 0x22a48b5a8e47ff78), ("e1e2", 0x652a607ca3f242c1), ("e8f7", 0x00fdd303c946bdd9)]:
+            board.make_move(notation_to_position(move[:2]), notation_to_position(move[2:]))
+            assert board.polyglot_key == key
+
+        board = PlayableBoard()
+        for move in ["a2a4", "b7b5", "h2h4", "b5b4", "c2c4"]:
+            board.make_move(notation_to_position(move[:2]), notation_to_position(move[2:]))
+        assert board.polyglot_key == 0x3c8123ea7b067637
+
+        assert decode_polyglot_move(63 | 55 << 6 | 4 << 12) == ((7, 6), (7, 7), "queen")
+        assert decode_polyglot_move(7 | 4 << 6) == ((4, 0), (7, 0))
+
+    def test_fen_round_trip(self):
+        for fen in [STARTING_FEN,
+                    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                    "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w Kq f6 0 3"]:
+            board = PlayableBoard.from_fen(fen)
+            assert board.to_fen() == fen
+            assert_bitboards_match(board)
+            assert board.zobrist_key == board.compute_zobrist_key()
+        # the pawn that jumped can be taken, not only written back out
+        assert ((4, 4), (5, 5)) in board.generate_legal_moves()
+
+        # the counters follow the moves and are taken back with them
+        board = PlayableBoard.from_fen(STARTING_FEN)
+        undos = [board.make_move((6, 0), (5, 2)), board.make_move((6, 7), (5, 5))]
+        assert board.to_fen().endswith(" 2 2")
+        undos.append(board.make_move((4, 1), (4, 3)))
+        assert board.to_fen() == "rnbqkb1r/pppppppp/5n2/8/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq e3 0 2"
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        assert board.to_fen() == STARTING_FEN
+        assert PlayableBoard().to_fen() == STARTING_FEN
+
+        assert PlayableBoard.from_fen("8/8/8/8/8/8/8/K6k b - - 12").to_fen() == "8/8/8/8/8/8/8/K6k b - - 12 1"
+        for fen in ["8/8/8/8/8/8/8/K6k b - - x 1", "8/8/8/8/8/8/8/K6k b - - 0 1 2", "8/8/8/8/8/8/K6k w - -"]:
+            with pytest.raises(ValueError):
+                PlayableBoard.from_fen(fen)
+
+    def test_read_epd(self, tmp_path):
+        assert parse_epd('4k3/8/8/8/8/8/8/4K3 w - - bm Kd2; id "a;b"; hmvc 7;') == \
+            ("4k3/8/8/8/8/8/8/4K3 w - - 7 1", {"bm": ["Kd2"], "id": ["a;b"], "hmvc": ["7"]})
+        assert parse_epd("4k3/8/8/8/8/8/8/4K3 b - - 3 40 ;D1 5 ;D2 25")[0] == "4k3/8/8/8/8/8/8/4K3 b - - 3 40"
+
+        (tmp_path / "positions.epd").write_text(
+            f"{STARTING_FEN[:-4]} id \"start\";\n\n"
+            "# a comment\n"
+            "4k3/8/8/8/8/8/8/4K3 b - - ;D1 5\n")
+        records = [(board.to_fen(), operations) for board, operations in read_epd(tmp_path / "positions.epd")]
+        assert records == [(STARTING_FEN, {"id": ["start"]}), ("4k3/8/8/8/8/8/8/4K3 b - - 0 1", {"D1": ["5"]})]
+
+        (tmp_path / "bad.epd").write_text(f"{STARTING_FEN[:-4]}\n8/8 w - -\n")
+        with pytest.raises(ValueError, match="Line 2"):
+            list(read_epd(tmp_path / "bad.epd", board=PlayableBoard()))
+
+    def test_legal_moves_by_position(self):
+        board = PlayableBoard()
+        for position in [(5, 0), (6, 0)]:
+            del board[position]
+
+        moves = board.get_legal_moves_by_position("white")
+        assert moves[(4, 0)] == board.get_legal_moves((4, 0))
+        # the rook can be picked up to castle as well
+        assert (4, 0) in moves[(7, 0)] and (7, 0) in moves[(4, 0)]
+        assert sum(len(destinations) for destinations in moves.values()) == len(board.generate_move_array("white")) + 1
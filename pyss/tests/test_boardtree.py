@@ -1,6 +1,19 @@
+import random
+from array import array
+
 import pytest
 
+from pyss.game.board.bitboard import BITS, to_square
+
 from pyss.game.board.depth import Chessboard
+from pyss.game.board.fen import load_fen
+from pyss.game.board.depth.perft import REFERENCE_POSITIONS, perft, main as perft_main
+from pyss.game.board.depth.transposition import EXACT, LOWER, TranspositionTable
+from pyss.game.board.depth.tree import ROOT, MoveCursor, MoveTree
+
+
+def count_nodes(tree, node=ROOT):
+    return 1 + sum(count_nodes(tree, child) for child in tree.children(node))
 
 
 class TestSuite:
@@ -11,3 +24,188 @@ class TestSuite:
         tree = board.valid_move_tree()
 
         print(tree)
+        assert tree is not None
+
+    def test_transposition_table(self):
+        table = TranspositionTable(mb=1)
+        assert len(table) * 16 <= 1024 * 1024
+
+        table.store(0x1234, depth=3, value=-250, flag=LOWER, move=0xBEEF)
+        assert table.probe(0x1234) == (3, -250, LOWER, 0xBEEF)
+        assert table.probe(0x4321) is None
+
+        # a shallower result for the same bucket goes to the always-replace slot
+        other = 0x1234 + (len(table) // 2)
+        table.store(other, depth=1)
+        assert table.probe(0x1234)[0] == 3
+        assert table.probe(other)[0] == 1
+
+        # a deeper one takes the depth-preferred slot and pushes the old entry down
+        deeper = 0x1234 + len(table)
+        table.store(deeper, depth=5, value=7)
+        assert table.probe(deeper) == (5, 7, EXACT, 0)
+        assert table.probe(0x1234)[0] == 3
+        assert table.probe(other) is None
+
+    def test_shared_transposition_table(self):
+        buffer = bytearray(TranspositionTable.nbytes(1))
+        writer = TranspositionTable(mb=1, buffer=buffer)
+        reader = TranspositionTable(mb=1, buffer=buffer)
+
+        writer.store(0x1234, depth=2, value=-3, move=7)
+        assert reader.probe(0x1234) == (2, -3, EXACT, 7)
+
+        # a torn entry, the key of one store with the data of another, doesn't match
+        writer._data[(0x1234 & writer._mask) << 1] ^= 1 << 16
+        assert reader.probe(0x1234) is None
+
+        reader.clear()
+        assert writer.probe(0x1234) is None
+        writer.close()
+        reader.close()
+
+    def test_boardtree_transpositions(self):
+        board = Chessboard(hash_mb=1)
+        tree = board.valid_move_tree(depth=1)
+        nodes = count_nodes(tree)
+        assert nodes == 1 + 20 + 400
+
+        # the root is already expanded, so nothing is added again
+        assert board.valid_move_tree(depth=1) is tree
+        assert count_nodes(tree) == nodes
+
+    def test_walk_valid_moves(self):
+        board = Chessboard()
+        key = board.zobrist_key
+
+        records = list(board.walk_valid_moves(depth=2))
+        assert len(records) == 20 + 400 + 8902
+        assert records[0] == (2, (), records[0][2])
+        assert records[1][:2] == (1, (records[0][2],))
+        assert board.zobrist_key == key
+
+        # stopped by the budgets and resumed, the walk yields the same records
+        cursor = MoveCursor()
+        resumed = list(board.walk_valid_moves(depth=2, nodes=1000, cursor=cursor))
+        assert len(resumed) == 1000 and not cursor.done
+        resumed += board.walk_valid_moves(depth=2, time_limit=0, cursor=cursor)
+        while not cursor.done:
+            resumed += board.walk_valid_moves(depth=2, nodes=3000, cursor=cursor)
+        assert resumed == records and cursor.nodes == len(records)
+
+        # a partial tree is finished by the next call
+        board = Chessboard(hash_mb=1)
+        tree = board.valid_move_tree(depth=1, nodes=100)
+        assert count_nodes(tree) == 1 + 100
+        assert board.valid_move_tree(depth=1) is tree
+        assert count_nodes(tree) == 1 + 20 + 400
+
+    def test_move_tree_arrays(self):
+        board = Chessboard(hash_mb=1)
+        tree = board.valid_move_tree(depth=1)
+        assert len(tree) == count_nodes(tree) == 1 + 20 + 400
+        assert tree.nbytes == len(tree) * 14
+        # the tree's table is sized for its walk, not for the board's searches
+        assert len(tree.transpositions) * 16 <= 4096
+
+        # children come back in the order they were generated
+        first_moves = [tree.move(child) for child in tree.children()]
+        assert first_moves == board.generate_legal_moves()
+
+        node = tree.children(tree.children()[3])[7]
+        assert tree.depth(node) == 2 and tree.parent(tree.parent(node)) == ROOT
+        path = tree.path(node)
+
+        expected = Chessboard()
+        for move in path:
+            expected.make_move(*move)
+        assert tree.to_board(node).zobrist_key == expected.zobrist_key
+
+        # replayed in place, the board is back at the root once the path is unmade
+        undos = tree.make_path(board, node)
+        assert board.zobrist_key == expected.zobrist_key
+        for undo in reversed(undos):
+            board.unmake_move(undo)
+        assert board.zobrist_key == tree.starting_board.zobrist_key
+
+    def test_move_tree_save_load(self, tmp_path):
+        board = load_fen(Chessboard(hash_mb=1), REFERENCE_POSITIONS[1][1])
+        tree = board.valid_move_tree(depth=1)
+        tree.save(tmp_path / "tree.bin")
+
+        loaded = MoveTree.load(tmp_path / "tree.bin")
+        assert isinstance(loaded._moves, memoryview)
+        assert len(loaded) == len(tree) == 1 + 48 + 2039
+        assert loaded.starting_fen == tree.starting_fen == REFERENCE_POSITIONS[1][1]
+        assert loaded.cursor.done and loaded.cursor.depth == 1
+
+        node = loaded.children(loaded.children()[-1])[-1]
+        assert loaded.path(node) == tree.path(node)
+        assert loaded.to_board(node).zobrist_key == tree.to_board(node).zobrist_key
+
+        # adding a move copies the columns out of the file
+        child = loaded.add_move(loaded.move(node), ROOT)
+        assert loaded.children()[-1] == child and isinstance(loaded._moves, array)
+        loaded.close()
+
+        (tmp_path / "bad.bin").write_bytes(b"not a tree" * 4)
+        with pytest.raises(ValueError):
+            MoveTree.load(tmp_path / "bad.bin")
+
+    @pytest.mark.parametrize("name, fen, expected", REFERENCE_POSITIONS)
+    def test_perft_reference_positions(self, name, fen, expected):
+        for depth, count in enumerate(expected[:2], 1):
+            assert perft(fen, depth)[0] == count
+
+    def test_perft_divide(self):
+        board = Chessboard()
+        assert board.perft(3) == 8902
+
+        nodes, divide, _ = perft(REFERENCE_POSITIONS[1][1], 2)
+        assert nodes == 2039
+        # castles are written as the king's step, not as the king taking its rook
+        assert divide["e1g1"] == divide["e1c1"] == 43
+        assert len(divide) == 48
+
+    def test_perft_epd(self, tmp_path, capsys):
+        (tmp_path / "suite.epd").write_text(f"{REFERENCE_POSITIONS[2][1]} ;D1 14 ;D2 191 ;D3 2812\n"
+                                            f"{REFERENCE_POSITIONS[3][1]} id \"bad\"; D1 7;\n")
+        assert perft_main(["--epd", str(tmp_path / "suite.epd"), "-d", "2"]) == 1
+
+        out = capsys.readouterr().out
+        assert "#1 depth 2: 191 nodes" in out and "depth 3" not in out
+        assert "bad depth 1: 6 nodes" in out and "FAILED, expected 7" in out
+
+    def test_all_valid_moves_to_depth(self):
+        board = load_fen(Chessboard(), "4k3/8/8/8/3Q4/8/8/4K3 w - - 0 1")
+        key = board.zobrist_key
+
+        # every square but the kings' and its own within two moves, each only once
+        levels = board.all_valid_moves_to_depth((3, 3), depth=3)
+        assert [(depth, len(moves)) for depth, moves in levels] == [(3, 27), (2, 34), (1, 0), (0, 0)]
+        squares = [move for _, moves in levels for move in moves]
+        assert len(set(squares)) == len(squares) == 64 - 3
+        assert board.zobrist_key == key
+
+        board = Chessboard()
+        assert board.all_valid_moves_to_depth((6, 0), depth=0) == [(0, [(5, 2), (7, 2)])]
+        assert (3, 3) in board.all_valid_moves_to_depth((6, 0), depth=1)[1][1]
+
+    def test_depth_footprint(self):
+        rng = random.Random(3)
+        board = Chessboard()
+        for _ in range(20):
+            cached = {}
+            for _, position in list(board.active_pieces.items()):
+                depth_moves = board.all_valid_moves_to_depth(position, depth=1)
+                reachable = [move for _, valid_moves in depth_moves for move in valid_moves]
+                cached[position] = depth_moves, board.depth_footprint(position, reachable)
+
+            undo = board.move(*rng.choice(board.generate_legal_moves()))
+            board.active_color = "black" if board.active_color == "white" else "white"
+            changed = sum(BITS[to_square(position)] for position in board.changed_positions(undo))
+
+            # a move outside a piece's footprint leaves its depth moves as they were
+            for position, (depth_moves, footprint) in cached.items():
+                if not footprint & changed:
+                    assert board.all_valid_moves_to_depth(position, depth=1) == depth_moves
@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+from pyss.app.depth_worker import DepthWorker
+from pyss.game.board.depth import Chessboard
+
+
+def wait_for(worker, timeout=30):
+    finished = []
+    deadline = time.time() + timeout
+    while worker.busy and time.time() < deadline:
+        finished.extend(worker.poll())
+        time.sleep(0.01)
+    return finished
+
+
+class TestSuite:
+    def test_depth_jobs(self):
+        board = Chessboard()
+        worker = DepthWorker()
+        try:
+            worker.submit(board, (6, 0), 2)
+            # the jobs work on a snapshot, the board can move on meanwhile
+            board.make_move((4, 1), (4, 3))
+
+            # the rings come from the one search as it goes, each as if searched to its own depth,
+            # one may be overtaken by the full map
+            finished = wait_for(worker)
+            assert finished[-1][:2] == ((6, 0), 2)
+            assert [depth for _, depth, _ in finished] in ([1, 2], [2])
+            for position, depth, depth_moves in finished:
+                assert depth_moves == Chessboard().all_valid_moves_to_depth(position, depth=depth)
+
+            # stale jobs are dropped, the others are kept even if the pool has to restart
+            worker.submit(board, (6, 0), 3)
+            worker.submit(board, (1, 0), 1, rings=False)
+            worker.cancel((6, 0))
+            assert not worker.pending((6, 0)) and worker.pending((1, 0))
+            assert [(position, depth) for position, depth, _ in wait_for(worker)] == [((1, 0), 1)]
+
+            worker.submit(board, (6, 0), 3)
+            worker.cancel()
+            assert not worker.busy and worker.poll() == []
+        finally:
+            worker.shutdown()
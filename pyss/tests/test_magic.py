@@ -0,0 +1,33 @@
+import random
+
+import pytest
+
+from pyss.game.board import magic
+from pyss.game.board.bitboard import BITS
+
+
+class TestSuite:
+    def test_attacks_match_ray_walk(self):
+        rng = random.Random(124)
+        for kind in magic.KINDS:
+            directions = magic._directions(kind)
+            for _ in range(2000):
+                square = rng.randrange(64)
+                occupied = rng.getrandbits(64) & rng.getrandbits(64)
+                assert magic.TABLES[kind].attacks(square, occupied) == \
+                    magic.slow_attacks(square, occupied, directions)
+
+    def test_queen_uses_both_tables(self):
+        assert magic.LINE_KINDS["queen"] == ("rook", "bishop")
+        assert magic.slider_attacks("queen", 0, BITS[9] | BITS[1]) == BITS[9] | BITS[1] | magic.rook_attacks(0, BITS[1])
+
+    def test_cache_roundtrip(self, tmp_path):
+        path = tmp_path / "magics.bin"
+        magic.dump_tables(magic.TABLES, path)
+        tables = magic.load_tables(path)
+
+        for kind in magic.KINDS:
+            assert tables[kind].arrays() == magic.TABLES[kind].arrays()
+
+        path.write_bytes(b"garbage")
+        assert magic.load_tables(path) is None
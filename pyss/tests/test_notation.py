@@ -4,7 +4,6 @@ from pyss.game.notation import generate_notation, parse_notation
 
 
 class TestSuite:
-    @pytest.mark.skip
     def test_notation(self):
         # based on:
         # http://www.chesscorner.com/tutorial/basic/notation/notate.htm
@@ -18,7 +17,7 @@ class TestSuite:
             "6. h2 pawn captures g3, d6 bishop captures g3",
             " ... checkmate"]
 
-        print(parse_notation(game_notes))
+        assert parse_notation(game_notes) == expected
 
     @pytest.mark.skip
     def test_generate_notation(self):
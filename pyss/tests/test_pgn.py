@@ -0,0 +1,120 @@
+import io
+from collections import Counter
+
+import pytest
+
+from pyss.game.board.depth import Chessboard
+from pyss.game.board.fen import load_fen
+from pyss.game.pgn import ingest, parse_game, parse_move, read_pgn, read_positions, shard_offsets
+
+
+OPERA = """[Event "Casual game"]
+[Site "Paris FRA"]
+[White "Paul Morphy"]
+[Black "Duke Karl / Count Isouard"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 d6 3. d4 Bg4 {This is a weak move already.} 4. dxe5 Bxf3 5. Qxf3 dxe5
+6. Bc4 Nf6 7. Qb3 Qe7 8. Nc3 c6 9. Bg5 b5 $2 10. Nxb5! cxb5 11. Bxb5+ Nbd7
+12. O-O-O Rd8 13. Rxd7 Rxd7 (13... Nxd7 14. Qb8+ {
+[is still mate]}) 14. Rd1 Qe6 15. Bxd7+ Nxd7 16. Qb8+ Nxb8 17. Rd8# 1-0
+"""
+
+ENDGAME = """[Event "Study"]
+[SetUp "1"]
+[FEN "4k3/P7/8/3pP3/8/8/8/4K3 w - d6 0 1"]
+
+1. exd6 Kd7 2. a8=N (2. a8=Q Kxd6) 2... Kxd6 *
+"""
+
+QUEENS_GAMBIT = """[Event "Blitz"]
+[Result "1/2-1/2"]
+1.d4 d5 2.c4 e6 ; the rest { of the line
+3.Nc3 Nf6 4.e2e3 1/2-1/2
+
+"""
+
+
+class TestSuite:
+    def test_parse_move(self):
+        board = load_fen(Chessboard(), "r3k2r/8/8/8/2N5/8/8/RN2K2R w KQkq - 0 1")
+        assert parse_move(board, "O-O") == ((4, 0), (7, 0))
+        assert parse_move(board, "Nc3") == ((1, 0), (2, 2))
+        assert parse_move(board, "Nbd2") == ((1, 0), (3, 1))
+        assert parse_move(board, "Ncd2+") == ((2, 3), (3, 1))
+        # a king's two steps is castling, a rook's move needs its file
+        assert parse_move(board, "e1g1") == ((4, 0), (7, 0))
+        assert parse_move(board, "Rhf1") == ((7, 0), (5, 0))
+        with pytest.raises(ValueError, match="castle"):
+            parse_move(board, "0-0-0")
+        with pytest.raises(ValueError, match="Ambiguous"):
+            parse_move(board, "Nd2")
+        with pytest.raises(ValueError):
+            parse_move(board, "Kf3")
+        with pytest.raises(ValueError):
+            parse_move(board, "hello")
+
+        board = load_fen(Chessboard(), "7k/1P6/8/8/8/8/8/1N2K1N1 w - - 0 1")
+        assert parse_move(board, "b8=R") == ((1, 6), (1, 7), "rook")
+        assert parse_move(board, "b8") == ((1, 6), (1, 7), "queen")
+        assert parse_move(board, "b7b8n") == ((1, 6), (1, 7), "knight")
+        with pytest.raises(ValueError, match="Invalid"):
+            parse_move(board, "b8=K")
+
+    def test_parse_game(self):
+        # the long algebraic movetext of test_notation
+        game = parse_game("1.f2-f4\te7-e5\n2.f4xe5\td7-d6\n3.e5xd6\tBf8xd6\n4.g2-g3\tQd8-g5\n5.Ng1-f3\tQg5xg3+\n"
+                          "6.h2xg3\tBd6xg3#")
+        assert game.headers == {} and game.result == "*"
+        assert game.moves == [((5, 1), (5, 3)), ((4, 6), (4, 4)), ((5, 3), (4, 4)), ((3, 6), (3, 5)),
+                              ((4, 4), (3, 5)), ((5, 7), (3, 5)), ((6, 1), (6, 2)), ((3, 7), (6, 4)),
+                              ((6, 0), (5, 2)), ((6, 4), (6, 2)), ((7, 1), (6, 2)), ((3, 5), (6, 2))]
+        board = game.board()
+        assert board.in_check("white") and not board.generate_move_array("white")
+
+    def test_read_pgn(self):
+        games = list(read_pgn(io.StringIO(OPERA + "\n" + ENDGAME + QUEENS_GAMBIT)))
+        assert len(games) == 3
+
+        opera, endgame, queens_gambit = games
+        assert opera.headers["White"] == "Paul Morphy" and opera.result == "1-0"
+        assert len(opera.moves) == 33
+        assert opera.moves[22] == ((4, 0), (0, 0)) and opera.moves[-1] == ((3, 0), (3, 7))
+        board = opera.board()
+        assert board.in_check("black") and not board.generate_move_array("black")
+
+        assert endgame.moves == [((4, 4), (3, 5)), ((4, 7), (3, 6)), ((0, 6), (0, 7), "knight"), ((3, 6), (3, 5))]
+        assert endgame.board()[(0, 7)].type == "knight" and endgame.result == "*"
+
+        # the brace after a line comment opens no comment, the last move is long algebraic
+        assert len(queens_gambit.moves) == 7 and queens_gambit.result == "1/2-1/2"
+
+        with pytest.raises(ValueError, match="Illegal move 'Ke2'"):
+            list(read_pgn(io.StringIO(OPERA.replace("Rd1", "Ke2"))))
+        assert len(list(read_pgn(io.StringIO(OPERA.replace("Rd1", "Ke2") + ENDGAME), skip_errors=True))) == 1
+
+    def test_read_positions(self, tmp_path):
+        path = tmp_path / "games.pgn"
+        path.write_text(OPERA + ENDGAME)
+
+        keys = [(game.headers["Event"], board.zobrist_key) for game, board in read_positions(path)]
+        assert len(keys) == 34 + 5
+        assert keys[0][1] == Chessboard().zobrist_key and keys[34][0] == "Study"
+
+    def test_ingest(self, tmp_path):
+        path = tmp_path / "games.pgn"
+        path.write_text((OPERA + "\n" + ENDGAME + "\n" + QUEENS_GAMBIT) * 20)
+
+        offsets = shard_offsets(path, 8)
+        assert offsets[0] == 0 and offsets[-1] == path.stat().st_size and offsets == sorted(set(offsets))
+        with open(path, "rb") as f:
+            for offset in offsets[1:-1]:
+                f.seek(offset)
+                assert f.readline().startswith(b"[Event ")
+
+        results = Counter(ingest(path, _result, processes=2, shards=8))
+        assert results == {"1-0": 20, "*": 20, "1/2-1/2": 20}
+
+
+def _result(game):
+    return game.result
@@ -29,3 +29,18 @@ class TestSuite:
         assert diff1 != diff4
         assert diff2 != diff5
         assert diff3 != diff6
+
+    def test_flyweight(self):
+        p1 = Piece("white", "pawn")
+        p2 = Piece("white", "pawn")
+
+        assert p1.data is p2.data
+        assert not hasattr(p1, "__dict__")
+        assert p1.valid_relative_moves == ((0, 1),)
+        assert p1.valid_captures == ((-1, 1), (1, 1))
+        assert Piece("black", "queen").unicode == "♛"
+        assert Piece("black", "knight").initial_positions == ((1, 7), (6, 7))
+        assert Piece("white", "king").valid_captures == ()
+
+        p1.has_moved = True
+        assert not p2.has_moved
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from pyss.ai.simple import MATE, SimpleEngine
+from pyss.ai.tablebase import DRAW, LOSS, WIN, Tablebase, Tablebases, canonical_signature, parse_signature
+from pyss.game.board.depth import Chessboard
+from pyss.game.board.fen import load_fen
+
+
+@pytest.fixture(scope="module")
+def tablebases(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("tablebases")
+    tablebases = Tablebases(directory)
+    tablebases.generate("KQvK")
+    yield tablebases
+    tablebases.close()
+
+
+def probe(tablebases, fen):
+    return tablebases.probe(load_fen(Chessboard(), fen))
+
+
+class TestSuite:
+    def test_signatures(self):
+        assert parse_signature("KRPvKR") == (("rook", "pawn"), ("rook",))
+        assert canonical_signature(("queen",), ()) == ("KQvK", False)
+        assert canonical_signature((), ("queen",)) == ("KQvK", True)
+        with pytest.raises(ValueError):
+            parse_signature("KQK")
+        with pytest.raises(ValueError):
+            Tablebase("KPvKP")
+
+    def test_kqk(self, tablebases):
+        table = tablebases.table("KQvK")
+        results = [table.value(*table.decode(i)) for i in range(table.size)]
+        # the longest mate is 10 moves, and white to move never fails to win
+        assert max(plies for wdl, plies in filter(None, results) if wdl == WIN) == 19
+        assert all(result[0] == WIN for i, result in enumerate(results) if result and table.decode(i)[1] == 0)
+
+        assert probe(tablebases, "6k1/8/6K1/8/8/8/8/Q7 w - - 0 1") == (WIN, 1)
+        assert probe(tablebases, "7k/8/6K1/8/8/8/8/1Q6 b - - 0 1") == (LOSS, 2)
+        # stalemate, and a queen left hanging
+        assert probe(tablebases, "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1") == (DRAW, 0)
+        assert probe(tablebases, "8/8/8/8/8/8/6kQ/4K3 b - - 0 1") == (DRAW, 0)
+        # the same positions mirrored, rotated and with the colors swapped
+        assert probe(tablebases, "1k6/8/1K6/8/8/8/8/7Q w - - 0 1") == (WIN, 1)
+        assert probe(tablebases, "q7/8/8/8/8/6k1/8/6K1 b - - 0 1") == (WIN, 1)
+
+    def test_load(self, tablebases):
+        # a fresh collection maps the saved table
+        loaded = Tablebases(tablebases.directory)
+        assert loaded.max_pieces == 3
+        table = loaded.table("KQvK")
+        assert isinstance(table.values, memoryview)
+        assert list(table.values) == list(tablebases.table("KQvK").values)
+        assert loaded.table("KRvK") is None
+        assert probe(loaded, "8/8/8/3k4/8/8/8/R3K3 w - - 0 1") is None
+        loaded.close()
+
+    def test_flipped_signature(self, tmp_path):
+        # the weaker side named first still builds and saves the table probes look up
+        tablebases = Tablebases(tmp_path)
+        assert tablebases.generate("KvKQ").signature == "KQvK"
+        assert os.listdir(tmp_path) == ["KQvK.pytb"]
+        assert probe(tablebases, "6K1/8/6k1/8/8/8/8/q7 b - - 0 1") == (WIN, 1)
+        assert probe(Tablebases(tmp_path), "6K1/8/6k1/8/8/8/8/q7 b - - 0 1") == (WIN, 1)
+        tablebases.close()
+
+    def test_engine(self, tablebases):
+        board = load_fen(Chessboard(), "6k1/8/6K1/8/8/8/8/Q7 w - - 0 1")
+        result = SimpleEngine(board, tablebases=tablebases).search(depth=3)
+        assert result.move == ((0, 0), (6, 6)) and result.value == MATE - 1 and result.nodes == 0
+
+        # taking the rook leads into the table, which knows the mate
+        board = load_fen(Chessboard(), "8/8/8/3k4/8/8/3r4/3QK3 w - - 0 1")
+        result = SimpleEngine(board, tablebases=tablebases).search(depth=1)
+        assert result.move[1] == (3, 1) and result.mate is not None